@@ -2,7 +2,7 @@
 # Licencia de uso restringido – ver LICENSE.txt
 # Juan Arnau
 
-from VaultDBManager import add_entry
+from VaultDBManager import add_entry, entry_exists, upsert_entry
 import secrets
 import string
 from PySide6.QtGui import QClipboard
@@ -67,7 +67,23 @@ class AddEntryDialog(QDialog):
         if len(password) < 12 or not any(c in string.punctuation for c in password):
             QMessageBox.warning(self, "Contraseña débil", "Usa al menos 12 caracteres y símbolos especiales.")
             return
-        add_entry(self.key, service, username, password, notes, owner_id=self.owner_id)
+        exists = entry_exists(service, username, owner_id=self.owner_id)
+        if exists:
+            reply = QMessageBox.question(
+                self, "Entrada existente",
+                f"Ya existe una entrada para {service} / {username}.\n¿Deseas sobrescribirla?",
+                QMessageBox.Yes | QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
+        try:
+            if exists:
+                upsert_entry(self.key, service, username, password, notes, owner_id=self.owner_id)
+            else:
+                add_entry(self.key, service, username, password, notes, owner_id=self.owner_id)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"No se pudo guardar la entrada:\n{e}")
+            return
         QMessageBox.information(self, "✅ Entrada añadida", f"Se ha guardado la entrada para {service}.")
         self.accept()
     def generate_password(self, length=16):
@@ -0,0 +1,194 @@
+# Copyright © 2025 Juan Arnau
+# Licencia de uso restringido – ver LICENSE.txt
+# Juan Arnau
+
+import csv
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+AUDIT_DB_PATH = Path.home() / ".vaultion" / "audit.db"
+AUDIT_QUERY_PAGE_SIZE = 1000
+AUDIT_CSV_FIELDS = ["seq", "timestamp", "action", "owner_id", "details", "hash"]
+
+# 🗂️ Índice del historial: el JSON Lines es la fuente de verdad; esta base se puede reconstruir
+AUDIT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit_events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    owner_id TEXT,
+    action TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_audit_owner_ts ON audit_events(owner_id, ts);
+CREATE INDEX IF NOT EXISTS idx_audit_action_ts ON audit_events(action, ts);
+CREATE INDEX IF NOT EXISTS idx_audit_ts ON audit_events(ts);
+"""
+
+# 🕒 Segundos epoch; las marcas del historial son ISO en UTC sin zona
+def to_epoch(value) -> float:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+def encode_record(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+class AuditIndex:
+    def __init__(self, path=AUDIT_DB_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    # 🔌 Una conexión por hilo: el hilo escritor inserta, la interfaz consulta (WAL)
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # reconstruible desde el JSON Lines
+            conn.executescript(AUDIT_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _row(record: dict):
+        try:
+            ts = to_epoch(record.get("timestamp"))
+        except (ValueError, TypeError):
+            ts = 0.0
+        return (ts or 0.0, record.get("owner_id"), record.get("action"), encode_record(record))
+
+    # ✍️ Segundo sumidero de AuditQueue: un lote, una transacción
+    def write_batch(self, records):
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO audit_events (ts, owner_id, action, record) VALUES (?, ?, ?, ?)",
+                [self._row(record) for record in records]
+            )
+
+    # 🔁 Vaciar y volver a indexar desde un iterable de registros
+    def rebuild(self, records, batch_size: int = AUDIT_QUERY_PAGE_SIZE) -> int:
+        conn = self.connection()
+        count = 0
+        with conn:
+            conn.execute("DELETE FROM audit_events")
+            batch = []
+            for record in records:
+                batch.append(self._row(record))
+                if len(batch) == batch_size:
+                    conn.executemany("INSERT INTO audit_events (ts, owner_id, action, record) VALUES (?, ?, ?, ?)", batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                conn.executemany("INSERT INTO audit_events (ts, owner_id, action, record) VALUES (?, ?, ?, ?)", batch)
+                count += len(batch)
+        return count
+
+    def first_record(self) -> str:
+        row = self.connection().execute("SELECT record FROM audit_events ORDER BY id LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def last_record(self) -> str:
+        row = self.connection().execute("SELECT record FROM audit_events ORDER BY id DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _filters(owner_id=None, action=None, since=None, until=None):
+        clauses, params = [], []
+        if owner_id is not None:
+            clauses.append("owner_id = ?")
+            params.append(owner_id)
+        if action is not None:
+            clauses.append("action = ?")
+            params.append(action)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(to_epoch(since))
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(to_epoch(until))
+        return clauses, params
+
+    def count(self, owner_id=None, action=None, since=None, until=None) -> int:
+        clauses, params = self._filters(owner_id, action, since, until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self.connection().execute(f"SELECT COUNT(*) FROM audit_events {where}", params).fetchone()[0]
+
+    # 🔎 Recorrido en orden cronológico por páginas (keyset sobre (ts, id)), filtrado por índice
+    def query(self, owner_id=None, action=None, since=None, until=None, limit: int = None,
+              page_size: int = AUDIT_QUERY_PAGE_SIZE):
+        clauses, params = self._filters(owner_id, action, since, until)
+        after = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page_clauses = clauses + (["(ts, id) > (?, ?)"] if after else [])
+            page_params = params + (list(after) if after else [])
+            where = f"WHERE {' AND '.join(page_clauses)}" if page_clauses else ""
+            size = page_size if remaining is None else min(page_size, remaining)
+            rows = self.connection().execute(
+                f"SELECT ts, id, record FROM audit_events {where} ORDER BY ts, id LIMIT ?",
+                page_params + [size]
+            ).fetchall()
+            for _, _, record in rows:
+                yield json.loads(record)
+            if len(rows) < size:
+                return
+            after = rows[-1][:2]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    # 🕘 Últimos N eventos (del más reciente al más antiguo); before=(ts, id) pide la página siguiente
+    def last_events(self, n: int = 100, owner_id=None, action=None, before=None) -> list:
+        clauses, params = self._filters(owner_id, action)
+        if before is not None:
+            clauses.append("(ts, id) < (?, ?)")
+            params.extend(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.connection().execute(
+            f"SELECT ts, id, record FROM audit_events {where} ORDER BY ts DESC, id DESC LIMIT ?",
+            params + [n]
+        ).fetchall()
+        events = []
+        for ts, row_id, record in rows:
+            event = json.loads(record)
+            event["_cursor"] = (ts, row_id)
+            events.append(event)
+        return events
+
+    # 📄 Exportación en streaming: JSON (array) o CSV según la extensión
+    def export(self, path, fmt: str = None, **filters) -> int:
+        fmt = (fmt or Path(path).suffix.lstrip(".") or "json").lower()
+        if fmt not in ("json", "csv"):
+            raise ValueError(f"❌ Formato de exportación no soportado: {fmt}")
+        count = 0
+        with open(path, "w", encoding="utf-8", newline="") as out:
+            if fmt == "csv":
+                writer = csv.DictWriter(out, fieldnames=AUDIT_CSV_FIELDS, extrasaction="ignore")
+                writer.writeheader()
+                for record in self.query(**filters):
+                    writer.writerow(record)
+                    count += 1
+                return count
+            out.write("[")
+            for record in self.query(**filters):
+                out.write(",\n  " if count else "\n  ")
+                out.write(json.dumps(record, ensure_ascii=False))
+                count += 1
+            out.write("\n]\n" if count else "]\n")
+        return count
@@ -1,12 +1,710 @@
 # Copyright © 2025 Juan Arnau
 # Licencia de uso restringido – ver LICENSE.txt
 # Juan Arnau
- 
+
+import os
 import json
+import gzip
+import base64
+import hashlib
+import time
+import atexit
+import shutil
+import sqlite3
+import threading
+from collections import deque
 from datetime import datetime
 from pathlib import Path
+from AuditIndex import AuditIndex, encode_record
+from KeySigner import load_signing_key, sign_key, verify_signature, public_key_pem, load_public_key
+
+AUDIT_DIR = Path.home() / ".vaultion"
+LOG_PATH = AUDIT_DIR / "audit_log.json"      # 🧳 formato antiguo: array JSON reescrito entero
+AUDIT_PATH = AUDIT_DIR / "audit_log.jsonl"   # 📜 una línea JSON por evento, solo se añade
+AUDIT_SIGNING_KEY_PATH = AUDIT_DIR / "audit_signing.pem"
+# 📌 La clave pública de los checkpoints se fija en vault_meta para que verificar no cree ni cambie claves.
+# ⚠️ Ni la clave privada (sin cifrar) ni vault_meta están protegidas: la cadena y las firmas detectan
+# corrupción accidental o ediciones torpes, no a quien pueda reescribir ~/.vaultion a propósito.
+AUDIT_PUBLIC_KEY_META = "audit_public_key"
+
+# ⛓️ Cadena de hashes: cada evento lleva seq, el hash del anterior (prev) y el suyo (hash)
+GENESIS_HASH = "0" * 64
+AUDIT_CHECKPOINT_EVERY = 1000  # checkpoint firmado cada N eventos (y al rotar o cerrar)
+
+# 🔁 Rotación: el segmento activo se archiva comprimido al superar tamaño o antigüedad
+AUDIT_MAX_BYTES = 5 * 1024 * 1024
+AUDIT_MAX_AGE = 30 * 86400  # segundos
+
+# 💾 Política de fsync
+FSYNC_ALWAYS = "always"      # cada escritura llega al disco antes de volver
+FSYNC_INTERVAL = "interval"  # como mucho un fsync cada FSYNC_INTERVAL_SECONDS
+FSYNC_NEVER = "never"        # lo decide el sistema operativo
+FSYNC_INTERVAL_SECONDS = 1.0
+
+# 📮 Cola en segundo plano: log_action solo encola; un hilo escribe por lotes
+AUDIT_QUEUE_SIZE = 10000
+AUDIT_BATCH_SIZE = 256
+AUDIT_BATCH_INTERVAL = 0.5  # segundos que espera un lote incompleto antes de escribirse
+AUDIT_BLOCK_TIMEOUT = 2.0   # con OVERFLOW_BLOCK, espera máxima antes de descartar
+
+# 🚦 Qué hacer con la cola llena
+OVERFLOW_BLOCK = "block"              # esperar hueco (hasta block_timeout)
+OVERFLOW_DROP_NEWEST = "drop_newest"  # descartar el evento que llega
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # descartar el evento más antiguo pendiente
+
+# 📜 Escritor de auditoría en JSON Lines: coste constante por evento
+class AuditWriter:
+    def __init__(self, path=AUDIT_PATH, fsync_policy: str = FSYNC_ALWAYS,
+                 fsync_interval: float = FSYNC_INTERVAL_SECONDS, max_bytes: int = AUDIT_MAX_BYTES,
+                 max_age: float = AUDIT_MAX_AGE, legacy_path=LOG_PATH, checkpoint_path=None,
+                 checkpoint_every: int = AUDIT_CHECKPOINT_EVERY, signing_key_path=AUDIT_SIGNING_KEY_PATH,
+                 pin_public_key=None):
+        if fsync_policy not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError(f"❌ Política de fsync desconocida: {fsync_policy}")
+        self.path = Path(path)
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else self.path.with_name(
+            f"{self.path.stem}_checkpoints{self.path.suffix}"
+        )
+        self.checkpoint_every = checkpoint_every
+        self.signing_key_path = signing_key_path
+        self.pin_public_key = pin_public_key
+        self._key_pinned = pin_public_key is None
+
+        self.lock = threading.Lock()
+        self.file = None
+        self.size = 0
+        self.opened_at = None
+        self.last_fsync = 0.0
+
+        self.seq = 0
+        self.last_hash = GENESIS_HASH
+        self.last_offset = None  # inicio de la última línea escrita en el segmento activo
+        self.checkpoint_seq = 0
+        self._signing_key = None
+
+    @property
+    def rotating_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".rotating")
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 🧯 Rotación interrumpida: terminar de archivar el segmento pendiente
+        if self.rotating_path.exists():
+            self._archive(self.rotating_path)
+        if self.legacy_path and self.legacy_path.exists():
+            self._migrate_legacy()
+
+        self._truncate_torn_tail()
+        self.file = open(self.path, "ab")
+        self.size = self.file.tell()
+        self.opened_at = self._segment_started()
+        self.last_offset = None
+        if self.seq == 0:
+            self._restore_chain()
+
+    # 🧯 Una línea a medias tras un corte se descarta; si no, el siguiente evento quedaría pegado a ella
+    def _truncate_torn_tail(self):
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            return
+        with open(self.path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b"\n":
+                return
+            end = f.seek(0, os.SEEK_END)
+            block = min(end, 65536)
+            while True:
+                f.seek(end - block)
+                cut = f.read(block).rfind(b"\n")
+                if cut >= 0 or block == end:
+                    f.truncate(end - block + cut + 1)
+                    return
+                block = min(end, block * 4)
+
+    # ⛓️ Continuar la cadena desde el último evento escrito (segmento activo o último archivo)
+    def _restore_chain(self):
+        last = _tail_record(self.path) if self.size else None
+        if last is None:
+            archives = self.archives()
+            if archives:
+                with gzip.open(archives[-1], "rb") as f:
+                    for last in _iter_lines(f):
+                        pass
+        if last and "hash" in last and "seq" in last:
+            self.seq = last["seq"]
+            self.last_hash = last["hash"]
+            self.checkpoint_seq = self.seq
+
+    # 🧳 Migración única del array JSON antiguo (se conserva renombrado)
+    def _migrate_legacy(self):
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            records = []
+        with open(self.path, "ab") as out:
+            for record in records:
+                out.write(_encode(record))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(self.legacy_path, self.legacy_path.with_name(self.legacy_path.name + ".migrated"))
+
+    # 🕒 Inicio del segmento activo: marca de tiempo de su primer evento
+    def _segment_started(self) -> float:
+        if self.size == 0:
+            return time.time()
+        with open(self.path, "rb") as f:
+            first = f.readline()
+        try:
+            return datetime.fromisoformat(json.loads(first)["timestamp"]).timestamp()
+        except (ValueError, KeyError, TypeError):
+            return os.path.getmtime(self.path)
+
+    def write(self, record: dict):
+        self.write_batch([record])
+
+    # ✍️ Varios eventos con una sola escritura (y un solo fsync); la cadena se asigna aquí, en orden de fichero
+    def write_batch(self, records):
+        with self.lock:
+            if self.file is None:
+                self.open()
+            state = (self.seq, self.last_hash, self.last_offset)
+            lines = []
+            offset = self.size
+            for record in records:
+                self.seq += 1
+                record["seq"] = self.seq
+                record["prev"] = self.last_hash
+                record["hash"] = self.last_hash = chain_hash(record)
+                line = _encode(record)
+                self.last_offset = offset
+                offset += len(line)
+                lines.append(line)
+            data = b"".join(lines)
+            try:
+                self.file.write(data)
+                self.file.flush()
+            except OSError:
+                self.seq, self.last_hash, self.last_offset = state
+                raise
+            self.size += len(data)
+            self._sync()
+            if self.checkpoint_every and self.seq - self.checkpoint_seq >= self.checkpoint_every:
+                self._checkpoint(self.path.name, self.last_offset)
+            if self._should_rotate():
+                self._rotate()
+
+    def signing_key(self):
+        if self._signing_key is None:
+            self._signing_key = load_signing_key(self.signing_key_path)
+        if not self._key_pinned:
+            # 🔁 Si la bóveda no está disponible se reintenta en el siguiente checkpoint;
+            # con otra clave ya fijada lanza ValueError y el checkpoint no se firma
+            self._key_pinned = self.pin_public_key(self._signing_key.public_key())
+        return self._signing_key
+
+    # 🔏 Checkpoint firmado: (seq, hash) del último evento y dónde empieza su línea
+    def _checkpoint(self, segment: str, offset: int):
+        if offset is None or self.seq == self.checkpoint_seq:
+            return
+        if self.file is not None:
+            self._sync(force=True)  # el evento debe estar en disco antes que su checkpoint
+        checkpoint = {
+            "seq": self.seq,
+            "hash": self.last_hash,
+            "segment": segment,
+            "offset": offset,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        try:
+            signature = sign_key(self.signing_key(), _canonical(checkpoint))
+            checkpoint["signature"] = base64.b64encode(signature).decode("ascii")
+            with open(self.checkpoint_path, "ab") as f:
+                f.write(_encode(checkpoint))
+                f.flush()
+                os.fsync(f.fileno())
+            self.checkpoint_seq = self.seq
+        except (OSError, ValueError) as e:
+            # ⚠️ Sin checkpoint la cadena sigue siendo válida: la próxima verificación solo tarda más
+            print(f"⚠️ No se pudo firmar el checkpoint de auditoría: {e}")
+
+    def _sync(self, force: bool = False):
+        now = time.monotonic()
+        if (force or self.fsync_policy == FSYNC_ALWAYS
+                or (self.fsync_policy == FSYNC_INTERVAL and now - self.last_fsync >= self.fsync_interval)):
+            os.fsync(self.file.fileno())
+            self.last_fsync = now
+
+    def _should_rotate(self) -> bool:
+        if self.max_bytes and self.size >= self.max_bytes:
+            return True
+        return bool(self.max_age) and time.time() - self.opened_at >= self.max_age
+
+    # 🔁 Renombrar el segmento (atómico) y comprimirlo; se sigue escribiendo en uno nuevo
+    def _rotate(self):
+        self._sync(force=True)
+        self.file.close()
+        self.file = None
+        offset = self.last_offset
+        os.replace(self.path, self.rotating_path)
+        archive = self._archive(self.rotating_path)
+        self._checkpoint(archive.name, offset)
+        self.open()
+
+    def _archive(self, source: Path):
+        # 🔤 Nombre ordenable: fecha y contador de ancho fijo (orden lexicográfico = cronológico)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        counter = 0
+        archive = self.path.with_name(f"{self.path.stem}-{stamp}-{counter:04d}{self.path.suffix}.gz")
+        while archive.exists():
+            counter += 1
+            archive = self.path.with_name(f"{self.path.stem}-{stamp}-{counter:04d}{self.path.suffix}.gz")
+        partial = archive.with_name(archive.name + ".part")
+        with open(source, "rb") as src, open(partial, "wb") as raw:
+            with gzip.GzipFile(filename=self.path.name, mode="wb", fileobj=raw) as dst:
+                shutil.copyfileobj(src, dst)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(partial, archive)
+        source.unlink()
+        return archive
+
+    # 📦 Archivos comprimidos, del más antiguo al más reciente
+    def archives(self) -> list:
+        return sorted(self.path.parent.glob(f"{self.path.stem}-*{self.path.suffix}.gz"))
+
+    # 📂 Abrir sin escribir nada (termina rotaciones pendientes y migra el JSON antiguo)
+    def ensure_open(self):
+        with self.lock:
+            if self.file is None:
+                self.open()
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                self._sync(force=True)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self._sync(force=True)
+                self._checkpoint(self.path.name, self.last_offset)
+                self.file.close()
+                self.file = None
+
+# 📮 Sumidero asíncrono: encolar es O(1) y nunca toca el disco en el hilo que llama
+class AuditQueue:
+    def __init__(self, writer: AuditWriter, maxsize: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 batch_interval: float = AUDIT_BATCH_INTERVAL, overflow: str = OVERFLOW_BLOCK,
+                 block_timeout: float = AUDIT_BLOCK_TIMEOUT, sinks=(), prepare=None):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST):
+            raise ValueError(f"❌ Política de desbordamiento desconocida: {overflow}")
+        self.writer = writer
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.sinks = list(sinks)  # 🗂️ destinos secundarios (p. ej. el índice SQLite), tras el JSON Lines
+        self.prepare = prepare    # 🔄 tarea inicial del hilo escritor (p. ej. poner el índice al día)
+        self._prepared = prepare is None
+
+        self.dropped = 0
+        self.errors = 0
+        self._items = deque()
+        self._pending = 0   # encolados o en escritura, aún no en disco
+        self._flushing = 0  # llamadas a flush() esperando: el lote sale sin agotar el intervalo
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def put(self, record: dict) -> bool:
+        with self._cond:
+            if self._closed:
+                # 🧯 Eventos tras el cierre (atexit): se escriben directamente
+                self.writer.write(record)
+                return True
+            while len(self._items) >= self.maxsize:
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._items.popleft()
+                    self._pending -= 1
+                    self.dropped += 1
+                    break
+                if not self._cond.wait(self.block_timeout) and len(self._items) >= self.maxsize:
+                    self.dropped += 1
+                    return False
+            self._items.append(record)
+            self._pending += 1
+            self._start()
+            if len(self._items) >= self.batch_size:
+                self._cond.notify_all()
+            return True
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="AuditWriter", daemon=True)
+            self._thread.start()
+
+    def start(self):
+        with self._cond:
+            self._start()
+
+    def _prepare(self):
+        try:
+            self.prepare()
+        except (OSError, sqlite3.Error) as e:
+            self.errors += 1
+            print(f"⚠️ Error al preparar el historial de auditoría: {e}")
+        finally:
+            with self._cond:
+                self._prepared = True
+                self._cond.notify_all()
+
+    # 🔁 Hilo escritor: un lote al llenarse o al vencer el intervalo, lo que llegue antes
+    def _run(self):
+        if not self._prepared:
+            self._prepare()
+        while True:
+            with self._cond:
+                while not self._items and not self._closed:
+                    self._cond.wait()
+                if not self._items:
+                    for sink in self.sinks:
+                        sink.close()
+                    return
+                deadline = time.monotonic() + self.batch_interval
+                while len(self._items) < self.batch_size and not self._closed and not self._flushing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._items.popleft() for _ in range(min(len(self._items), self.batch_size))]
+                # 🚦 Hay hueco: despertar a quien espera con OVERFLOW_BLOCK
+                self._cond.notify_all()
+
+            try:
+                self.writer.write_batch(batch)
+            except OSError as e:
+                self.errors += 1
+                print(f"❌ Error al escribir {len(batch)} eventos de auditoría: {e}")
+            else:
+                # 🗂️ Los sumideros solo reciben lo que ya está en el JSON Lines (la fuente de verdad)
+                for sink in self.sinks:
+                    try:
+                        sink.write_batch(batch)
+                    except (OSError, sqlite3.Error) as e:
+                        self.errors += 1
+                        print(f"⚠️ Error al indexar {len(batch)} eventos de auditoría: {e}")
 
-LOG_PATH = Path.home() / ".vaultion" / "audit_log.json"
+            with self._cond:
+                self._pending -= len(batch)
+                self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return self._pending
+
+    # 💾 Esperar a que todo lo encolado hasta ahora esté escrito (y sincronizado)
+    def flush(self, timeout: float = None) -> bool:
+        with self._cond:
+            if not self._closed:
+                self._start()
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                done = self._cond.wait_for(lambda: self._pending == 0 and (self._prepared or self._closed), timeout)
+            finally:
+                self._flushing -= 1
+        self.writer.flush()
+        return done
+
+    # 🛑 Cierre limpio: vaciar la cola, parar el hilo y cerrar el fichero
+    def close(self, timeout: float = None):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.writer.close()
+
+def _encode(record: dict) -> bytes:
+    return encode_record(record).encode("utf-8") + b"\n"
+
+# 📐 JSON canónico (claves ordenadas): lo que se hashea y se firma
+def _canonical(record: dict) -> bytes:
+    return json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+def chain_hash(record: dict) -> str:
+    body = {k: v for k, v in record.items() if k != "hash"}
+    return hashlib.sha256(record.get("prev", GENESIS_HASH).encode("ascii") + _canonical(body)).hexdigest()
+
+# 🔚 Último evento legible de un segmento, leyendo solo el final del fichero
+def _tail_record(path: Path):
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        block = min(end, 65536)
+        while block:
+            f.seek(end - block)
+            lines = f.read(block).split(b"\n")
+            if block < end:
+                lines = lines[1:]  # la primera puede estar cortada
+            for line in reversed(lines):
+                if line.strip():
+                    try:
+                        return json.loads(line)
+                    except ValueError:
+                        continue
+            if block == end:
+                return None
+            block = min(end, block * 4)
+    return None
+
+def _iter_lines(stream):
+    for line in stream:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue  # 🧯 Última línea a medias tras un corte: se ignora
+
+# 📖 Recorrer todo el historial (archivos y segmento activo) sin cargarlo en memoria
+def iter_audit_records(writer: "AuditWriter" = None):
+    if writer is None:
+        get_audit_queue().flush()
+        writer = get_audit_writer()
+    writer.flush()
+    for archive in writer.archives():
+        with gzip.open(archive, "rb") as f:
+            yield from _iter_lines(f)
+    if writer.path.exists():
+        with open(writer.path, "rb") as f:
+            yield from _iter_lines(f)
+
+def _open_segment(path: Path):
+    return gzip.open(path, "rb") if path.suffix == ".gz" else open(path, "rb")
+
+def load_checkpoints(writer: "AuditWriter" = None) -> list:
+    writer = writer or get_audit_writer()
+    if not writer.checkpoint_path.exists():
+        return []
+    with open(writer.checkpoint_path, "rb") as f:
+        return list(_iter_lines(f))
+
+def _checkpoint_signed(checkpoint: dict, public_key) -> bool:
+    body = {k: v for k, v in checkpoint.items() if k != "signature"}
+    try:
+        signature = base64.b64decode(checkpoint.get("signature", ""), validate=True)
+    except ValueError:
+        return False
+    return verify_signature(public_key, _canonical(body), signature)
+
+# ⚓ Comprobar que el evento al que apunta un checkpoint sigue ahí, intacto
+def _checkpoint_anchor(segments: list, checkpoint: dict):
+    names = [segment.name for segment in segments]
+    if checkpoint.get("segment") not in names:
+        return None
+    position = names.index(checkpoint["segment"])
+    with _open_segment(segments[position]) as f:
+        f.seek(checkpoint["offset"])
+        line = f.readline()
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if (record.get("seq") != checkpoint["seq"] or record.get("hash") != checkpoint["hash"]
+            or chain_hash(record) != checkpoint["hash"]):
+        return None
+    return position, checkpoint["offset"] + len(line), checkpoint["hash"], checkpoint["seq"]
+
+# 📌 Fijar la clave pública de auditoría en la bóveda; la primera que se fija no se reemplaza
+# False: la bóveda no está disponible (se reintenta). ValueError: ya hay otra clave fijada.
+def pin_audit_public_key(public_key) -> bool:
+    try:
+        from VaultDBManager import pin_meta
+        pinned = pin_meta(AUDIT_PUBLIC_KEY_META, public_key_pem(public_key))
+    except (ImportError, RuntimeError, OSError, sqlite3.Error) as e:
+        print(f"⚠️ No se pudo fijar la clave pública de auditoría: {e}")
+        return False
+    if pinned != public_key_pem(public_key):
+        raise ValueError("❌ La clave de firma de auditoría no coincide con la fijada en la bóveda")
+    return True
+
+def pinned_audit_public_key():
+    try:
+        from VaultDBManager import get_meta
+        pem = get_meta(AUDIT_PUBLIC_KEY_META)
+        return load_public_key(pem) if pem else None
+    except (ImportError, RuntimeError, OSError, ValueError, sqlite3.Error) as e:
+        print(f"⚠️ No se pudo leer la clave pública de auditoría: {e}")
+        return None
+
+AUDIT_MAX_REPORTED_ISSUES = 100
+
+# 🛡️ Verificar la cadena: por defecto desde el último checkpoint firmado cuyo evento sigue intacto
+# (coste proporcional a lo escrito desde entonces); full=True recorre todo el historial.
+# La firma se comprueba con public_key o con la fijada en la bóveda (nunca se crea una clave al
+# verificar); sin clave fijada se avisa y se verifica la cadena entera. Detecta corrupción
+# accidental, no manipulación deliberada: ver AUDIT_PUBLIC_KEY_META.
+def verify_audit_chain(writer: "AuditWriter" = None, full: bool = False, public_key=None) -> dict:
+    if writer is None:
+        get_audit_queue().flush()
+        writer = get_audit_writer()
+    writer.flush()
+    started = time.time()
+    public_key = public_key or pinned_audit_public_key()
+    segments = writer.archives() + ([writer.path] if writer.path.exists() else [])
+
+    report = {
+        "full": full,
+        "ok": True,
+        "checkpoint": None,
+        "checked": 0,
+        "unchained": 0,
+        "last_seq": None,
+        "last_hash": None,
+        "issues": [],
+        "issue_count": 0
+    }
+
+    def issue(problem, segment=None, offset=None, seq=None):
+        report["issue_count"] += 1
+        if len(report["issues"]) < AUDIT_MAX_REPORTED_ISSUES:
+            report["issues"].append({"segment": segment, "offset": offset, "seq": seq, "problem": problem})
+
+    signed = []
+    checkpoints = load_checkpoints(writer)
+    if public_key is None and checkpoints:
+        issue("No hay clave pública de auditoría fijada: no se pueden comprobar los checkpoints")
+        checkpoints = []
+    for checkpoint in checkpoints:
+        if _checkpoint_signed(checkpoint, public_key):
+            signed.append(checkpoint)
+        else:
+            issue("Firma de checkpoint inválida", checkpoint.get("segment"), checkpoint.get("offset"), checkpoint.get("seq"))
+    trusted = {checkpoint["seq"]: checkpoint["hash"] for checkpoint in signed}
+
+    start_position, start_offset, prev_hash, prev_seq = 0, 0, None, 0
+    if not full:
+        for checkpoint in reversed(signed):
+            anchor = _checkpoint_anchor(segments, checkpoint)
+            if anchor:
+                start_position, start_offset, prev_hash, prev_seq = anchor
+                report["checkpoint"] = {k: checkpoint[k] for k in ("seq", "segment", "offset", "timestamp")}
+                break
+
+    for position in range(start_position, len(segments)):
+        segment = segments[position].name
+        offset = start_offset if position == start_position else 0
+        with _open_segment(segments[position]) as f:
+            if offset:
+                f.seek(offset)
+            for line in f:
+                line_offset = offset
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    issue("Línea ilegible", segment, line_offset)
+                    continue
+                if "hash" not in record:
+                    if prev_hash is None:
+                        report["unchained"] += 1  # 🧳 historial anterior a la cadena
+                    else:
+                        issue("Evento sin encadenar", segment, line_offset)
+                    continue
+
+                seq = record.get("seq")
+                report["checked"] += 1
+                if record.get("prev") != (prev_hash or GENESIS_HASH) or seq != prev_seq + 1:
+                    issue("Cadena rota: prev o seq no coinciden con el evento anterior", segment, line_offset, seq)
+                if chain_hash(record) != record["hash"]:
+                    issue("Hash incorrecto: evento modificado", segment, line_offset, seq)
+                elif seq in trusted and trusted[seq] != record["hash"]:
+                    issue("No coincide con el checkpoint firmado", segment, line_offset, seq)
+                prev_hash = record["hash"]
+                prev_seq = seq if isinstance(seq, int) else prev_seq + 1
+
+    if prev_hash is not None:
+        report["last_seq"] = prev_seq
+        report["last_hash"] = prev_hash
+    if trusted and max(trusted) > prev_seq:
+        issue(f"Historial truncado: hay un checkpoint firmado en seq {max(trusted)}")
+
+    report["ok"] = report["issue_count"] == 0
+    report["duration_s"] = round(time.time() - started, 3)
+    return report
+
+# 🥇 Primer evento del historial (archivo más antiguo o, si no hay, segmento activo)
+def _first_record(writer: AuditWriter):
+    for segment in writer.archives() + ([writer.path] if writer.path.exists() else []):
+        with _open_segment(segment) as f:
+            for record in _iter_lines(f):
+                return record
+    return None
+
+# 🔄 Poner el índice al día (en el hilo escritor, tras abrir y migrar el historial).
+# Si no empieza por el primer evento del historial (vacío, o creado antes de migrar el JSON
+# antiguo) se reconstruye entero; si no, solo se añade lo que falte del segmento activo.
+def sync_audit_index(index: AuditIndex, writer: AuditWriter) -> int:
+    writer.ensure_open()
+    writer.flush()
+    first = _first_record(writer)
+    if index.first_record() != (encode_record(first) if first else None):
+        return index.rebuild(iter_audit_records(writer))
+    last = index.last_record()
+    if last is None or not writer.path.exists():
+        return 0
+    with open(writer.path, "rb") as f:
+        records = list(_iter_lines(f))
+    start = 0
+    for position in range(len(records) - 1, -1, -1):
+        if encode_record(records[position]) == last:
+            start = position + 1
+            break
+    missing = records[start:]
+    if missing:
+        index.write_batch(missing)
+    return len(missing)
+
+_writer = None
+_queue = None
+_index = None
+_writer_lock = threading.Lock()
+
+def get_audit_writer() -> AuditWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AuditWriter(pin_public_key=pin_audit_public_key)
+        return _writer
+
+def get_audit_index() -> AuditIndex:
+    global _index
+    writer = get_audit_writer()
+    with _writer_lock:
+        if _index is None:
+            # 🔄 Se pone al día en el hilo escritor (AuditQueue.prepare), no en el que llama
+            _index = AuditIndex()
+        return _index
+
+def get_audit_queue() -> AuditQueue:
+    global _queue
+    writer = get_audit_writer()
+    index = get_audit_index()
+    with _writer_lock:
+        if _queue is None:
+            _queue = AuditQueue(writer, sinks=[index], prepare=lambda: sync_audit_index(index, writer))
+            _queue.start()
+            atexit.register(_queue.close)
+        return _queue
 
 def log_action(action: str, owner_id: str, details: str = ""):
     entry = {
@@ -15,10 +713,23 @@ def log_action(action: str, owner_id: str, details: str = ""):
         "owner_id": owner_id,
         "details": details
     }
-    logs = []
-    if LOG_PATH.exists():
-        with open(LOG_PATH, "r", encoding="utf-8") as f:
-            logs = json.load(f)
-    logs.append(entry)
-    with open(LOG_PATH, "w", encoding="utf-8") as f:
-        json.dump(logs, f, indent=2)
\ No newline at end of file
+    get_audit_queue().put(entry)
+
+# 🔁 Reconstruir el índice desde el JSON Lines (si se borra o se desincroniza)
+def rebuild_audit_index() -> int:
+    get_audit_queue().flush()
+    return get_audit_index().rebuild(iter_audit_records())
+
+# 🔎 Consultas sobre el índice: antes se vacía la cola para ver lo último registrado
+def query_audit(owner_id: str = None, action: str = None, since=None, until=None, limit: int = None) -> list:
+    get_audit_queue().flush()
+    return list(get_audit_index().query(owner_id, action, since, until, limit))
+
+def last_audit_events(n: int = 100, owner_id: str = None, action: str = None, before=None) -> list:
+    get_audit_queue().flush()
+    return get_audit_index().last_events(n, owner_id, action, before)
+
+# 📄 Exportar en streaming a JSON o CSV (por extensión), con los mismos filtros que query_audit
+def export_audit(path, fmt: str = None, owner_id: str = None, action: str = None, since=None, until=None) -> int:
+    get_audit_queue().flush()
+    return get_audit_index().export(path, fmt, owner_id=owner_id, action=action, since=since, until=until)
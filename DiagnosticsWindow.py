@@ -2,16 +2,18 @@
 # Licencia de uso restringido – ver LICENSE.txt
 # Juan Arnau
  
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QMessageBox
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QMessageBox, QProgressBar
 from PySide6.QtCore import Qt
-from VaultDBManager import get_entries
+from VaultDBManager import get_vault_stats, invalidate_cache
+from VaultWorkers import IntegrityWorker
+from VaultDatabaseWindow import ErrorReportDialog
 import hashlib
 
 class DiagnosticsWindow(QWidget):
     def __init__(self, key: bytes, raw_key: bytes):
         super().__init__()
         self.setWindowTitle("🧪 Diagnóstico de Vaultion")
-        self.setFixedSize(600, 300)
+        self.setFixedSize(600, 460)
         self.setStyleSheet("background-color: #1e1e1e; color: #ffffff; font-size: 14px;")
 
         self.key = key
@@ -27,36 +29,127 @@ class DiagnosticsWindow(QWidget):
         self.entry_count_label = QLabel("📊 Entradas cifradas: ...")
         layout.addWidget(self.entry_count_label)
 
+        self.age_label = QLabel("🕒 Antigüedad: ...")
+        layout.addWidget(self.age_label)
+
+        self.storage_label = QLabel("💽 Base de datos: ...")
+        layout.addWidget(self.storage_label)
+
         self.btn_scan = QPushButton("🔍 Escanear integridad")
         self.btn_scan.clicked.connect(self.scan_database)
         layout.addWidget(self.btn_scan)
 
+        self.btn_verify = QPushButton("🛡️ Verificar cifrado")
+        self.btn_verify.clicked.connect(lambda: self.verify_integrity())
+        layout.addWidget(self.btn_verify)
+
+        self.verify_progress = QProgressBar()
+        self.verify_progress.setVisible(False)
+        layout.addWidget(self.verify_progress)
+
+        self.verifier = None
+        self.verify_token = 0
+
         self.setLayout(layout)
         self.update_entry_count()
 
+    # 🧹 Al cerrar: soltar las estadísticas cacheadas
+    def closeEvent(self, event):
+        invalidate_cache()
+        super().closeEvent(event)
+
+    # 📊 Solo SQL sobre columnas en claro: no se descifra nada
     def update_entry_count(self):
         try:
-            entries = get_entries(self.key, owner_id=self.owner_id)
-            self.entry_count_label.setText(f"📊 Entradas cifradas: {len(entries)}")
+            stats = get_vault_stats(self.owner_id)
+            storage = stats["storage"]
+            self.entry_count_label.setText(f"📊 Entradas cifradas: {stats['entries']}")
+            self.age_label.setText("🕒 Antigüedad: " + " · ".join(
+                f"{label}: {count}" for label, count in stats["age"].items()
+            ))
+            self.storage_label.setText(
+                f"💽 Base de datos: {storage['file_size'] / 1024:.0f} KB (+{storage['wal_size'] / 1024:.0f} KB WAL) · "
+                f"{storage['page_count']} páginas · {storage['freelist_count']} libres"
+            )
         except Exception as e:
             self.entry_count_label.setText("📊 Error al contar entradas")
             QMessageBox.critical(self, "Error", f"No se pudo acceder a la base:\n{e}")
 
     def scan_database(self):
         try:
-            entries = get_entries(self.key, owner_id=self.owner_id)
-            duplicates = set()
-            seen = set()
-            for entry in entries:
-                key = (entry["service"].lower(), entry["username"].lower())
-                if key in seen:
-                    duplicates.add(key)
-                seen.add(key)
+            duplicates = get_vault_stats(self.owner_id)["duplicates"]
 
             if duplicates:
-                msg = "\n".join([f"{s} / {u}" for s, u in duplicates])
+                msg = "\n".join([f"{d['service']} / {d['username']} ({d['count']})" for d in duplicates])
                 QMessageBox.warning(self, "⚠️ Duplicados detectados", f"Se han detectado entradas duplicadas:\n{msg}")
             else:
                 QMessageBox.information(self, "✅ Todo correcto", "No se han detectado duplicados ni errores.")
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"No se pudo escanear la base:\n{e}")
\ No newline at end of file
+            QMessageBox.critical(self, "Error", f"No se pudo escanear la base:\n{e}")
+
+    # 🛡️ Verificación completa en segundo plano (la ventana sigue respondiendo)
+    def verify_integrity(self, repair: bool = False):
+        if self.verifier is not None:
+            return
+        self.verify_token += 1
+        self.btn_verify.setEnabled(False)
+        self.verify_progress.setRange(0, 0)
+        self.verify_progress.setVisible(True)
+
+        self.verifier = IntegrityWorker(self.key, self.owner_id, repair=repair, token=self.verify_token)
+        self.verifier.signals.step.connect(self.on_verify_step)
+        self.verifier.signals.finished.connect(self.on_verify_finished)
+        self.verifier.signals.failed.connect(self.on_verify_failed)
+        self.verifier.start()
+
+    def on_verify_step(self, token, done, total):
+        if token != self.verify_token:
+            return
+        self.verify_progress.setRange(0, max(total, 1))
+        self.verify_progress.setValue(done)
+
+    def end_verify(self):
+        self.verifier = None
+        self.btn_verify.setEnabled(True)
+        self.verify_progress.setVisible(False)
+
+    def on_verify_failed(self, token, error):
+        if token != self.verify_token:
+            return
+        self.end_verify()
+        QMessageBox.critical(self, "Error", f"No se pudo verificar la base:\n{error}")
+
+    def on_verify_finished(self, token, report):
+        if token != self.verify_token:
+            return
+        self.end_verify()
+        self.update_entry_count()
+
+        sqlite_ok = report["sqlite_integrity"] == ["ok"]
+        summary = (
+            f"Entradas verificadas: {report['checked']} ({report['ok']} correctas)\n"
+            f"SQLite: {'ok' if sqlite_ok else '; '.join(report['sqlite_integrity'])}\n"
+            f"Reparadas: {report['repaired']}\n"
+            f"Informe: {report['report_path']}"
+        )
+        if sqlite_ok and not report["issues"]:
+            QMessageBox.information(self, "✅ Integridad correcta", summary)
+            return
+
+        QMessageBox.warning(self, "⚠️ Problemas de integridad", summary)
+        if report["issues"]:
+            ErrorReportDialog([
+                {"id": issue["id"], "service": issue["service"], "error": "; ".join(issue["problems"])}
+                for issue in report["issues"]
+            ]).exec()
+
+        pending = report["repairable"] - report["repaired"]
+        if pending > 0:
+            confirm = QMessageBox.question(
+                self, "🩹 Reparar entradas",
+                f"{pending} entradas tienen las notas dañadas pero la contraseña intacta.\n"
+                "¿Reescribirlas sin notas?",
+                QMessageBox.Yes | QMessageBox.No
+            )
+            if confirm == QMessageBox.Yes:
+                self.verify_integrity(repair=True)
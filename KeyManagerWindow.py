@@ -14,8 +14,7 @@ import platform
 import psutil
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
-
-AUTHORIZED_KEYS_PATH = Path("authorized_keys.json")
+from authorized_keys_manager import load_authorized_keys, add_key_extended, revoke_key as revoke_authorized_key
 
 class KeyManagerWindow(QWidget):
     def __init__(self):
@@ -56,11 +55,8 @@ class KeyManagerWindow(QWidget):
 
     def load_keys(self):
         self.table.setRowCount(0)
-        if not AUTHORIZED_KEYS_PATH.exists():
-            return
-
-        with open(AUTHORIZED_KEYS_PATH, "r", encoding="utf-8") as f:
-            keys = json.load(f)
+        # 🗝️ Registro compartido con la verificación USB (SQLite en ~/.vaultion)
+        keys = load_authorized_keys()
 
         for i, entry in enumerate(keys):
             self.table.insertRow(i)
@@ -87,7 +83,7 @@ class KeyManagerWindow(QWidget):
             btn_revoke.setIcon(btn_revoke.style().standardIcon(QStyle.SP_TrashIcon))
             btn_revoke.setToolTip("Revocar clave")
             btn_revoke.setStyleSheet("border: none; padding: 4px;")
-            btn_revoke.clicked.connect(lambda _, idx=i: self.revoke_key(idx))
+            btn_revoke.clicked.connect(lambda _, usb_id=entry["usb_id"]: self.revoke_key(usb_id))
 
             # Agrupar botones en layout
             action_widget = QWidget()
@@ -112,12 +108,8 @@ class KeyManagerWindow(QWidget):
             f.write(entry["public_key"])
         QMessageBox.information(self, "✅ Clave exportada", "Se ha guardado la clave como vaultion.key")
 
-    def revoke_key(self, index):
-        with open(AUTHORIZED_KEYS_PATH, "r", encoding="utf-8") as f:
-            keys = json.load(f)
-        removed = keys.pop(index)
-        with open(AUTHORIZED_KEYS_PATH, "w", encoding="utf-8") as f:
-            json.dump(keys, f, indent=2)
+    def revoke_key(self, usb_id):
+        revoke_authorized_key(usb_id)
         self.load_keys()
 
     def generate_rsa_key(self):
@@ -140,7 +132,8 @@ class KeyManagerWindow(QWidget):
             "public_key": pem
         }
 
-        self.save_key_entry(entry)
+        if not self.save_key_entry(entry):
+            return
         QMessageBox.information(self, "✅ Clave generada", f"Clave RSA creada con alias: {alias}")
         self.load_keys()
 
@@ -163,20 +156,17 @@ class KeyManagerWindow(QWidget):
             "public_key": pem
         }
 
-        self.save_key_entry(entry)
+        if not self.save_key_entry(entry):
+            return
         QMessageBox.information(self, "✅ Clave importada", f"Clave importada con alias: {alias}")
         self.load_keys()
 
-    def save_key_entry(self, entry: dict):
-        if AUTHORIZED_KEYS_PATH.exists():
-            with open(AUTHORIZED_KEYS_PATH, "r", encoding="utf-8") as f:
-                keys = json.load(f)
-        else:
-            keys = []
-
-        keys.append(entry)
-        with open(AUTHORIZED_KEYS_PATH, "w", encoding="utf-8") as f:
-            json.dump(keys, f, indent=2)
+    def save_key_entry(self, entry: dict) -> bool:
+        # ➕ Una fila nueva en el registro; el usb_id es único
+        if not add_key_extended(entry["alias"], entry["public_key"], entry["usb_id"], origin="manager"):
+            QMessageBox.warning(self, "Clave duplicada", f"Ya existe una clave registrada con ID: {entry['usb_id']}")
+            return False
+        return True
 
     def export_structured_key(self, entry, target_path):
         structured = {
@@ -219,12 +209,7 @@ class KeyManagerWindow(QWidget):
             QMessageBox.warning(self, "Advertencia", "El USB contiene archivos no autorizados.\nSe recomienda usar un USB limpio.")
             print(f"⚠️ Archivos encontrados en USB: {actual_files - allowed_files}")
 
-        if not AUTHORIZED_KEYS_PATH.exists():
-            QMessageBox.warning(self, "Sin claves", "No hay claves autorizadas para exportar.")
-            return
-
-        with open(AUTHORIZED_KEYS_PATH, "r", encoding="utf-8") as f:
-            keys = json.load(f)
+        keys = load_authorized_keys()
 
         if not keys:
             QMessageBox.warning(self, "Sin claves", "No hay claves disponibles.")
@@ -291,7 +276,8 @@ class KeyManagerWindow(QWidget):
                 "public_key": public_key
             }
 
-            self.save_key_entry(entry)
+            if not self.save_key_entry(entry):
+                return
             QMessageBox.information(self, "✅ Clave importada", f"Alias: {alias}\nID: {usb_id}")
             print(f"🔑 Clave importada: {entry}")
 
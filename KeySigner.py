@@ -2,14 +2,16 @@
 # Licencia de uso restringido – ver LICENSE.txt
 # Juan Arnau
  
+from pathlib import Path
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding, rsa
 
 SIGNING_KEY_PATH = Path("vaultion_signing.pem")
 
-def generate_signing_key():
+def generate_signing_key(path=SIGNING_KEY_PATH):
     private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
-    with open(SIGNING_KEY_PATH, "wb") as f:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
         f.write(private_key.private_bytes(
             encoding=serialization.Encoding.PEM,
             format=serialization.PrivateFormat.PKCS8,
@@ -17,6 +19,29 @@ def generate_signing_key():
         ))
     return private_key
 
+# 🔑 Cargar la clave de firma (se genera la primera vez si no existe)
+# ⚠️ Se guarda sin cifrar: quien pueda leer el fichero puede firmar con ella
+def load_signing_key(path=SIGNING_KEY_PATH, create: bool = True):
+    path = Path(path)
+    if not path.exists():
+        if not create:
+            raise FileNotFoundError(f"❌ No existe la clave de firma: {path}")
+        return generate_signing_key(path)
+    with open(path, "rb") as f:
+        return serialization.load_pem_private_key(f.read(), password=None)
+
+# 📌 Clave pública en PEM, para fijarla fuera de donde vive la clave privada
+def public_key_pem(public_key) -> str:
+    return public_key.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode("ascii")
+
+def load_public_key(pem):
+    if isinstance(pem, str):
+        pem = pem.encode("ascii")
+    return serialization.load_pem_public_key(pem)
+
 def sign_key(private_key, key_bytes: bytes) -> bytes:
     return private_key.sign(
         key_bytes,
@@ -7,7 +7,7 @@ from PySide6.QtCore import Qt
 from pathlib import Path
 import hashlib
 from VaultDBManager import backup_database
-from AuditLogger import log_action
+from AuditLogger import log_action, export_audit
 
 class SettingsWindow(QWidget):
     def __init__(self, raw_key: bytes):
@@ -49,14 +49,14 @@ class SettingsWindow(QWidget):
         QMessageBox.information(self, "✅ Copia creada", "Se ha creado una copia de seguridad de la base de datos.")
 
     def export_audit(self):
-        filename, _ = QFileDialog.getSaveFileName(self, "Exportar historial", "audit_log.json", "Archivo JSON (*.json)")
+        filename, selected = QFileDialog.getSaveFileName(
+            self, "Exportar historial", "audit_log.json", "Archivo JSON (*.json);;Archivo CSV (*.csv)"
+        )
         if filename:
             try:
-                from AuditLogger import LOG_PATH
-                with open(LOG_PATH, "r", encoding="utf-8") as f:
-                    data = f.read()
-                with open(filename, "w", encoding="utf-8") as out:
-                    out.write(data)
+                # 📄 Exportación en streaming desde el índice del historial
+                fmt = "csv" if filename.lower().endswith(".csv") or "csv" in selected.lower() else "json"
+                export_audit(filename, fmt)
                 QMessageBox.information(self, "✅ Exportación completa", f"Historial guardado en:\n{filename}")
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"No se pudo exportar el historial:\n{e}")
@@ -5,18 +5,17 @@
 from PySide6.QtWidgets import QApplication, QWidget, QLabel, QVBoxLayout, QPushButton, QMessageBox, QVBoxLayout
 from PySide6.QtCore import Qt, QTimer
 import sys
-from VaultDBManager import derive_key, initialize_database
+from VaultWorkers import UnlockWorker
 from vaultion_boot import boot_vaultion
 from KeyManagerWindow import KeyManagerWindow
 from VaultDatabaseWindow import VaultDatabaseWindow  # Asegúrate de tener este módulo
 from SettingsWindow import SettingsWindow            # Asegúrate de tener este módulo
 from pathlib import Path
 from DiagnosticsWindow import DiagnosticsWindow
+from VaultDBManager import end_session
 from PySide6.QtGui import QIcon
 from pathlib import Path
 from vaultion_boot import detect_usb_key, generate_new_key
-from vaultion_boot import get_database_path
-from VaultDBManager import initialize_database
 
 KEY_PATH = Path("D:/vaultion.key")  # Ajusta según tu ruta real
 KEY_FILE_PATH = Path("vaultion.key")
@@ -82,6 +81,7 @@ class UnlockScreen(QWidget):
             QMessageBox.Yes | QMessageBox.No
         )
         if respuesta == QMessageBox.Yes:
+            end_session()
             event.accept()
         else:
             event.ignore()
@@ -94,6 +94,7 @@ class UnlockScreen(QWidget):
             QMessageBox.Yes | QMessageBox.No
         )
         if respuesta == QMessageBox.Yes:
+            end_session()
             event.accept()
         else:
             event.ignore()
@@ -103,21 +104,15 @@ class UnlockScreen(QWidget):
 
     def check_usb(self):
         key_file = boot_vaultion()
-        db_path = get_database_path()
 
         if key_file and key_file != "invalid":
-            try:
-                with open(key_file, "rb") as f:
-                    raw_key = f.read()
-                self.raw_key = raw_key
-                self.key = derive_key(raw_key)
-                initialize_database(db_path)
-                self.status_label.setText("✅ USB autorizado. Accediendo...")
-                self.status_label.setStyleSheet("color: #00ff99; font-size: 16px;")
-                self.show_dashboard_buttons()
-            except Exception as e:
-                self.status_label.setText("❌ Error al procesar la clave.")
-                QMessageBox.critical(self, "Error", f"No se pudo procesar la clave:\n{e}")
+            # 🧵 KDF y preparación de la base en segundo plano: la ventana sigue respondiendo
+            self.status_label.setText("🔐 Verificando clave USB...")
+            self.unlock_worker = UnlockWorker(key_file)
+            self.unlock_worker.signals.progress.connect(self.on_unlock_progress)
+            self.unlock_worker.signals.finished.connect(self.on_unlock_finished)
+            self.unlock_worker.signals.failed.connect(self.on_unlock_failed)
+            self.unlock_worker.start()
 
         elif key_file == "invalid":
             self.status_label.setText("❌ Clave inválida. Acceso denegado.")
@@ -149,6 +144,20 @@ class UnlockScreen(QWidget):
                 self.close()
                 QApplication.instance().quit()
 
+    def on_unlock_progress(self, token, message):
+        self.status_label.setText(message)
+
+    def on_unlock_finished(self, token, result):
+        self.raw_key = result["raw_key"]
+        self.key = result["key"]
+        self.status_label.setText("✅ USB autorizado. Accediendo...")
+        self.status_label.setStyleSheet("color: #00ff99; font-size: 16px;")
+        self.show_dashboard_buttons()
+
+    def on_unlock_failed(self, token, error):
+        self.status_label.setText("❌ Error al procesar la clave.")
+        QMessageBox.critical(self, "Error", f"No se pudo procesar la clave:\n{error}")
+
     def show_dashboard_buttons(self):
         self.btn_keys.setVisible(True)
         self.btn_db.setVisible(True)
@@ -0,0 +1,49 @@
+# Copyright © 2025 Juan Arnau
+# Licencia de uso restringido – ver LICENSE.txt
+# Juan Arnau
+
+import time
+import threading
+from collections import OrderedDict
+
+ENTRY_CACHE_SIZE = 256
+ENTRY_CACHE_TTL = 120  # segundos
+
+# 🧠 Caché LRU con caducidad: cada valor guarda la época de la base en que se leyó
+class EntryCache:
+    def __init__(self, maxsize: int = ENTRY_CACHE_SIZE, ttl: float = ENTRY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # clave -> (caduca, época, valor)
+        self._lock = threading.Lock()
+
+    # 🔎 Solo vale si es de la época actual y no ha caducado
+    def get(self, key, epoch: int, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] != epoch or item[0] < time.monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[2]
+
+    def put(self, key, value, epoch: int):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, epoch, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    # 🧹 Soltar todo (cambio en la base o bloqueo de la bóveda)
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
@@ -0,0 +1,84 @@
+# Copyright © 2025 Juan Arnau
+# Licencia de uso restringido – ver LICENSE.txt
+# Juan Arnau
+
+from collections import namedtuple
+from functools import lru_cache
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+# 🔢 Identificadores de suite: es el byte de versión que precede a cada blob sellado
+SUITE_AES_EAX = 1            # pycryptodome, formato original nonce(16) + tag(16) + ct
+SUITE_AES_GCM = 2            # OpenSSL, nonce(12) + ct + tag(16)
+SUITE_CHACHA20_POLY1305 = 3  # OpenSSL, nonce(12) + ct + tag(16)
+DEFAULT_SUITE = SUITE_AES_GCM
+AEAD_NONCE_SIZE = 12
+
+CipherSuite = namedtuple("CipherSuite", ["name", "seal", "open"])
+
+# 🔐 AES-EAX (pycryptodome): se mantiene para leer todo lo escrito hasta ahora
+def _eax_seal(key: bytes, data: bytes, aad: bytes) -> bytes:
+    cipher = AES.new(key, AES.MODE_EAX)
+    if aad:
+        cipher.update(aad)
+    ciphertext, tag = cipher.encrypt_and_digest(data)
+    return cipher.nonce + tag + ciphertext
+
+def _eax_open(key: bytes, sealed: bytes, aad: bytes) -> bytes:
+    if len(sealed) < 32:
+        raise ValueError("❌ Añade la contraseña y una nota necesaria.")
+    cipher = AES.new(key, AES.MODE_EAX, nonce=sealed[:16])
+    if aad:
+        cipher.update(aad)
+    return cipher.decrypt_and_verify(sealed[32:], sealed[16:32])
+
+# ⚡ Primitivas AEAD de cryptography: el objeto se reutiliza por clave (lo vacía lock_vault)
+@lru_cache(maxsize=64)
+def _aead(suite_id: int, key: bytes):
+    return AESGCM(key) if suite_id == SUITE_AES_GCM else ChaCha20Poly1305(key)
+
+def _aead_seal(suite_id: int):
+    def seal_with(key: bytes, data: bytes, aad: bytes) -> bytes:
+        nonce = get_random_bytes(AEAD_NONCE_SIZE)
+        return nonce + _aead(suite_id, key).encrypt(nonce, data, aad or None)
+    return seal_with
+
+def _aead_open(suite_id: int):
+    def open_with(key: bytes, sealed: bytes, aad: bytes) -> bytes:
+        if len(sealed) < AEAD_NONCE_SIZE + 16:
+            raise ValueError("❌ Blob cifrado demasiado corto.")
+        try:
+            return _aead(suite_id, key).decrypt(sealed[:AEAD_NONCE_SIZE], sealed[AEAD_NONCE_SIZE:], aad or None)
+        except InvalidTag:
+            # 🧷 Mismo error que EAX: los llamadores solo capturan ValueError
+            raise ValueError("MAC check failed")
+    return open_with
+
+# 📜 Registro de suites: añadir una nueva solo requiere un identificador libre
+CIPHER_SUITES = {
+    SUITE_AES_EAX: CipherSuite("aes-256-eax", _eax_seal, _eax_open),
+    SUITE_AES_GCM: CipherSuite("aes-256-gcm", _aead_seal(SUITE_AES_GCM), _aead_open(SUITE_AES_GCM)),
+    SUITE_CHACHA20_POLY1305: CipherSuite(
+        "chacha20-poly1305", _aead_seal(SUITE_CHACHA20_POLY1305), _aead_open(SUITE_CHACHA20_POLY1305)
+    ),
+}
+
+def get_suite(suite_id: int) -> CipherSuite:
+    suite = CIPHER_SUITES.get(suite_id)
+    if suite is None:
+        raise ValueError(f"❌ Suite de cifrado desconocida: {suite_id}")
+    return suite
+
+# 🔐 Sellar con la suite indicada (sin prefijo: el llamador guarda el byte de versión)
+def seal(suite_id: int, key: bytes, data: bytes, aad: bytes = b"") -> bytes:
+    return get_suite(suite_id).seal(key, data, aad)
+
+# 🔓 Abrir un blob sellado con la suite indicada
+def open_sealed(suite_id: int, key: bytes, sealed: bytes, aad: bytes = b"") -> bytes:
+    return get_suite(suite_id).open(key, sealed, aad)
+
+# 🧹 Olvidar los objetos de cifrado cacheados (contienen la clave)
+def clear_cipher_cache():
+    _aead.cache_clear()
@@ -2,21 +2,181 @@
 # Licencia de uso restringido – ver LICENSE.txt
 # Juan Arnau
  
+import os
+import json
+import time
+import struct
 import sqlite3
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
-import shutil
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 from cryptography.hazmat.primitives import hashes
-from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
+from VaultCiphers import SUITE_AES_EAX, DEFAULT_SUITE, CIPHER_SUITES, seal, open_sealed, clear_cipher_cache
 from vaultion_boot import get_database_path
+from VaultMigrations import migrate_database, ensure_unique_index
+from VaultCache import EntryCache
 
 # 📁 Configuración
 SALT = b"vaultion_salt_001"
 VAULTION_HOME = Path.home() / ".vaultion"
 VAULTION_HOME.mkdir(parents=True, exist_ok=True)
 DB_PATH = VAULTION_HOME / "vaultion.db"
+STATEMENT_CACHE_SIZE = 256
+DEK_SIZE = 32
+UNREADABLE_GENERATION = 0  # 🧳 fila antigua ilegible con la clave maestra: conserva sus blobs, ninguna DEK la abre
+REKEY_BATCH_SIZE = 500
+ENTRY_PAGE_SIZE = 500
+DECRYPT_CHUNK_SIZE = 256
+# 📊 Tramos de antigüedad para las estadísticas: (etiqueta, días máximos)
+AGE_BUCKETS = [("< 30 días", 30), ("< 90 días", 90), ("< 1 año", 365), ("≥ 1 año", None)]
+ENTRY_CACHE_SECRETS = False  # 🧠 Guardar también secretos descifrados (desactivado: el texto en claro no se retiene)
+
+# 📦 Registro compacto: byte de suite + un único sello AEAD con contraseña y notas
+# (1 = AES-EAX, el formato original; las escrituras nuevas usan RECORD_SUITE)
+RECORD_SUITE = DEFAULT_SUITE
+RECORD_LENGTH = struct.Struct(">I")
+OWNER_REF = "(SELECT id FROM vault_owners WHERE owner_id = ?)"
+
+# ⏱️ Presupuesto de desbloqueo: coste del KDF calibrado por máquina
+KDF_TARGET_MS = 500
+KDF_SALT_SIZE = 16
+PBKDF2_MIN_ITERATIONS = 100_000
+SCRYPT_MIN_N = 2 ** 14
+SCRYPT_MAX_N = 2 ** 20
+SCRYPT_R = 8
+SCRYPT_P = 1
+LEGACY_KDF = {"algorithm": "pbkdf2-sha256", "salt": SALT.hex(), "iterations": 100_000}
+
+# 🔌 Pool de conexiones persistentes (una por hilo)
+_thread_local = threading.local()
+_pool_lock = threading.Lock()
+_open_connections = set()
+_schema_ready = set()
+_pool_generation = 0
+
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+# 🧹 Cerrar una conexión del pool (sin _pool_lock: también se llama al morir su hilo)
+def _release_connection(conn: sqlite3.Connection):
+    _open_connections.discard(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+# 🪦 Testigo en el threading.local del hilo: cuando el hilo termina se libera y cierra su conexión
+class _ConnectionOwner:
+    pass
+
+# 🔌 Conexión del hilo actual (se abre una sola vez y se reutiliza)
+def get_connection(db_path=None) -> sqlite3.Connection:
+    db_path = str(db_path or get_database_path())
+    conn = getattr(_thread_local, "conn", None)
+    if (conn is not None
+            and _thread_local.db_path == db_path
+            and _thread_local.generation == _pool_generation):
+        return conn
+    if conn is not None:
+        # 🔁 Otra base (o pool cerrado): la conexión anterior de este hilo no se abandona abierta
+        _thread_local.release()
+
+    conn = _open_connection(db_path)
+    with _pool_lock:
+        if db_path not in _schema_ready:
+            # 🚚 Migraciones versionadas: una sola vez por base de datos y proceso
+            migrate_database(conn)
+            ensure_unique_index(conn)
+            _schema_ready.add(db_path)
+        _open_connections.add(conn)
+        generation = _pool_generation
+
+    owner = _ConnectionOwner()
+    _thread_local.owner = owner
+    _thread_local.release = weakref.finalize(owner, _release_connection, conn)
+    _thread_local.generation = generation
+    _thread_local.conn = conn
+    _thread_local.db_path = db_path
+    return conn
+
+# 🔒 Transacción atómica sobre la conexión del hilo (commit o rollback)
+# BEGIN IMMEDIATE: el bloqueo de escritura se toma al entrar, así que lo que se lea dentro
+# (p. ej. la generación de DEK en _write_key) no puede cambiar antes del commit
+@contextmanager
+def transaction(db_path=None):
+    conn = get_connection(db_path)
+    with conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        yield conn.cursor()
+    invalidate_cache()
+
+# 🔌 Cerrar todas las conexiones abiertas (bloqueo o salida)
+def close_connections():
+    global _pool_generation, _watch_conn
+    with _pool_lock:
+        for conn in list(_open_connections):
+            _release_connection(conn)
+        _schema_ready.clear()
+        _pool_generation += 1
+    with _cache_lock:
+        if _watch_conn is not None:
+            _watch_conn.close()
+            _watch_conn = None
+        _bump_cache_epoch()
+
+# 🧠 Caché de lectura: páginas de metadatos, listados y (opcional) secretos descifrados
+_entry_cache = EntryCache()
+_cache_lock = threading.Lock()
+_cache_epoch = 0
+_watch_conn = None     # conexión vigía: solo consulta PRAGMA data_version
+_watch_path = None
+_watch_version = None
+
+def _bump_cache_epoch():
+    global _cache_epoch
+    _cache_epoch += 1
+    _entry_cache.clear()
+
+def invalidate_cache():
+    with _cache_lock:
+        _bump_cache_epoch()
+
+# 🧠 Época de la caché: avanza con cada commit propio (transaction) y con los commits
+# de cualquier otra conexión o proceso (PRAGMA data_version de la conexión vigía)
+def cache_epoch(db_path=None) -> int:
+    global _watch_conn, _watch_path, _watch_version
+    db_path = str(db_path or get_database_path())
+    with _cache_lock:
+        if _watch_conn is None or _watch_path != db_path:
+            if _watch_conn is not None:
+                _watch_conn.close()
+            _watch_conn = sqlite3.connect(db_path, check_same_thread=False)
+            _watch_path = db_path
+            _watch_version = None
+        version = _watch_conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != _watch_version:
+            _watch_version = version
+            _bump_cache_epoch()
+        return _cache_epoch
+
+# 🧠 Leer a través de la caché: load() solo se ejecuta si no hay un valor vigente
+def _read_through(cache_key, load):
+    epoch = cache_epoch()
+    value = _entry_cache.get(cache_key, epoch)
+    if value is None:
+        value = load()
+        _entry_cache.put(cache_key, value, epoch)
+    return value
 
 # 🔐 Derivar clave AES desde clave maestra
 def derive_key(secret: bytes, salt: bytes = SALT) -> bytes:
@@ -28,71 +188,299 @@ def derive_key(secret: bytes, salt: bytes = SALT) -> bytes:
     )
     return kdf.derive(secret)
 
+# 🔐 Derivar clave con parámetros explícitos (PBKDF2-SHA256 o scrypt)
+def derive_key_with_params(secret: bytes, params: dict) -> bytes:
+    salt = bytes.fromhex(params["salt"])
+    if params["algorithm"] == "scrypt":
+        kdf = Scrypt(salt=salt, length=32, n=params["n"], r=params["r"], p=params["p"])
+    elif params["algorithm"] == "pbkdf2-sha256":
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=params["iterations"])
+    else:
+        raise ValueError(f"❌ KDF desconocido: {params['algorithm']}")
+    return kdf.derive(secret)
+
+def _time_kdf(params: dict) -> float:
+    start = time.perf_counter()
+    derive_key_with_params(get_random_bytes(32), params)
+    return time.perf_counter() - start
+
+# ⏱️ Calibrar el coste del KDF para alcanzar la latencia objetivo en esta máquina
+def calibrate_kdf(target_ms: int = KDF_TARGET_MS, algorithm: str = "scrypt") -> dict:
+    target = target_ms / 1000
+    salt = get_random_bytes(KDF_SALT_SIZE).hex()
+
+    if algorithm == "scrypt":
+        params = {"algorithm": "scrypt", "salt": salt, "n": SCRYPT_MIN_N, "r": SCRYPT_R, "p": SCRYPT_P}
+        elapsed = _time_kdf(params)
+        # 📈 El coste de scrypt crece linealmente con n (potencia de 2)
+        while params["n"] < SCRYPT_MAX_N and elapsed * 2 <= target:
+            params["n"] *= 2
+            elapsed *= 2
+        return params
+
+    if algorithm == "pbkdf2-sha256":
+        probe = {"algorithm": "pbkdf2-sha256", "salt": salt, "iterations": 20_000}
+        elapsed = _time_kdf(probe)
+        iterations = int(probe["iterations"] * target / max(elapsed, 1e-6))
+        return {"algorithm": "pbkdf2-sha256", "salt": salt, "iterations": max(PBKDF2_MIN_ITERATIONS, iterations)}
+
+    raise ValueError(f"❌ KDF desconocido: {algorithm}")
+
+# 🔐 Cifrar bytes con AES-EAX (aad: datos autenticados pero no cifrados)
+def encrypt_bytes(key: bytes, data: bytes, aad: bytes = b"") -> bytes:
+    return seal(SUITE_AES_EAX, key, data, aad)
+
+# 🔓 Descifrar bytes con AES-EAX
+def decrypt_bytes(key: bytes, encrypted: bytes, aad: bytes = b"") -> bytes:
+    if not isinstance(encrypted, bytes):
+        raise TypeError(f"❌ encrypted no es bytes, es {type(encrypted)}")
+    return open_sealed(SUITE_AES_EAX, key, encrypted, aad)
+
 # 🔐 Cifrar texto plano con AES-EAX
 def encrypt_data(key: bytes, plaintext: str) -> bytes:
-    cipher = AES.new(key, AES.MODE_EAX)
-    ciphertext, tag = cipher.encrypt_and_digest(plaintext.encode())
-    return cipher.nonce + tag + ciphertext
+    return encrypt_bytes(key, plaintext.encode())
 
 # 🔓 Descifrar datos con AES-EAX
 def decrypt_data(key: bytes, encrypted: bytes) -> str:
-    if not isinstance(encrypted, bytes):
-        raise TypeError(f"❌ encrypted no es bytes, es {type(encrypted)}")
-    if len(encrypted) < 32:
-        raise ValueError("❌ Añade la contraseña y una nota necesaria.")
+    return decrypt_bytes(key, encrypted).decode()
+
+# 📦 Sellar contraseña y notas en un registro compacto (la cabecera va autenticada)
+def seal_record(key: bytes, password: str, notes: str = "", suite: int = None) -> bytes:
+    header = bytes([suite or RECORD_SUITE])
+    secret = password.encode()
+    payload = RECORD_LENGTH.pack(len(secret)) + secret + (notes or "").encode()
+    return header + seal(header[0], key, payload, aad=header)
+
+# 📦 Abrir un registro compacto con la suite que indique su cabecera
+def open_record(key: bytes, record: bytes) -> dict:
+    record = sanitize_blob(record)
+    if not record or record[0] not in CIPHER_SUITES:
+        raise ValueError(f"❌ Versión de registro desconocida: {record[0] if record else None}")
+    payload = open_sealed(record[0], key, record[1:], aad=record[:1])
+    end = RECORD_LENGTH.size + RECORD_LENGTH.unpack_from(payload)[0]
+    return {"password": payload[RECORD_LENGTH.size:end].decode(), "notes": payload[end:].decode()}
+
+# 🔓 Secretos de una fila en cualquiera de los dos formatos (registro compacto o dos blobs)
+def open_entry_secrets(key: bytes, record, encrypted_password, encrypted_notes, strict: bool = False) -> dict:
+    if record:
+        return open_record(key, record)
+    notes_blob = sanitize_blob(encrypted_notes) if encrypted_notes else b""
+    return {
+        "password": decrypt_data(key, sanitize_blob(encrypted_password)),
+        "notes": (decrypt_data(key, notes_blob) if notes_blob else "") if strict else safe_decrypt(notes_blob, key)
+    }
+
+def _ensure_owner(cursor, owner_id: str):
+    cursor.execute("INSERT OR IGNORE INTO vault_owners (owner_id) VALUES (?)", (owner_id,))
+
+# 🗂️ Metadatos de la bóveda (clave envuelta, parámetros...)
+def get_meta(name: str, default=None):
+    row = get_connection().execute("SELECT value FROM vault_meta WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else default
+
+# 📌 Guardar un metadato solo si no existe (nunca se sobrescribe); devuelve el valor guardado
+def pin_meta(name: str, value):
+    with transaction() as cursor:
+        cursor.execute("INSERT INTO vault_meta (name, value) VALUES (?, ?) ON CONFLICT(name) DO NOTHING", (name, value))
+    return get_meta(name)
+
+def _set_meta(cursor, name: str, value):
+    cursor.execute("""
+        INSERT INTO vault_meta (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = excluded.value
+    """, (name, value))
+
+# 🗝️ Llavero en memoria: DEKs desenvueltas por propietario y generación
+_unlock_lock = threading.Lock()
+_keyring = {}          # (owner_id, generation) -> dek
+_key_generations = {}  # dek -> generation
+_key_owners = {}       # dek -> owner_id
+
+def _dek_meta_name(owner_id: str) -> str:
+    return f"wrapped_dek:{owner_id}"
+
+def _retired_dek_meta_name(owner_id: str, generation: int) -> str:
+    return f"wrapped_dek:{owner_id}:{generation}"
+
+def _generation_meta_name(owner_id: str) -> str:
+    return f"dek_generation:{owner_id}"
+
+def _checkpoint_meta_name(owner_id: str) -> str:
+    return f"rekey_checkpoint:{owner_id}"
+
+def _envelope_report_meta_name(owner_id: str) -> str:
+    return f"envelope_migration:{owner_id}"
+
+def _kdf_meta_name(owner_id: str) -> str:
+    return f"kdf:{owner_id}"
+
+# ⚙️ Parámetros del KDF guardados en la bóveda (None = esquema antiguo con SALT fija)
+def get_kdf_params(owner_id: str = "default"):
+    stored = get_meta(_kdf_meta_name(owner_id))
+    return json.loads(stored) if stored else None
+
+def _remember_key(owner_id: str, generation: int, dek: bytes):
+    _keyring[(owner_id, generation)] = dek
+    _key_generations[dek] = generation
+    _key_owners[dek] = owner_id
+
+# 🧬 Generación con la que escribe una DEK (1 si no se desbloqueó por unlock_vault)
+def _generation_of(key: bytes) -> int:
+    return _key_generations.get(key, 1)
+
+# ✍️ DEK con la que se escribe: siempre la generación vigente del propietario, nunca la que traiga
+# el llamador. Se lee dentro de transaction() (BEGIN IMMEDIATE), así que reencrypt_vault no puede
+# retirar esa generación ni borrar su clave envuelta antes de que la escritura se confirme.
+def _write_key(cursor, key: bytes) -> tuple:
+    owner_id = _key_owners.get(key)
+    if owner_id is None:
+        return key, _generation_of(key)  # 🧳 clave sin sobre (no pasó por unlock_vault)
+    stored = cursor.execute(
+        "SELECT value FROM vault_meta WHERE name = ?", (_generation_meta_name(owner_id),)
+    ).fetchone()
+    generation = int(stored[0]) if stored else 1
+    current = _keyring.get((owner_id, generation))
+    if current is None:
+        raise ValueError("❌ La bóveda se ha vuelto a cifrar con otra clave: desbloquéala de nuevo.")
+    return current, generation
+
+# 🗝️ DEK correcta para descifrar una fila de cierta generación
+def key_for_generation(key: bytes, owner_id: str, generation: int) -> bytes:
+    return _keyring.get((owner_id, generation), key)
+
+def _retired_keys(owner_id: str):
+    prefix = _dek_meta_name(owner_id) + ":"
+    rows = get_connection().execute(
+        "SELECT name, value FROM vault_meta WHERE substr(name, 1, ?) = ?", (len(prefix), prefix)
+    ).fetchall()
+    return [(int(name[len(prefix):]), sanitize_blob(value)) for name, value in rows]
+
+def unlock_vault(master_key: bytes, owner_id: str = "default") -> bytes:
+    with _unlock_lock:
+        wrapped = get_meta(_dek_meta_name(owner_id))
+        if wrapped is None:
+            # 🧳 Bóveda antigua o nueva: generar DEK y migrar una sola vez
+            dek = _migrate_to_envelope(master_key, owner_id)
+            _remember_key(owner_id, 1, dek)
+            return dek
+
+        try:
+            dek = decrypt_bytes(master_key, sanitize_blob(wrapped))
+            # ♻️ Claves retiradas que aún cifran filas (re-cifrado en curso)
+            retired = [(gen, decrypt_bytes(master_key, blob)) for gen, blob in _retired_keys(owner_id)]
+        except ValueError:
+            raise ValueError("❌ La clave USB no corresponde a esta bóveda.")
+
+        for generation, retired_dek in retired:
+            _remember_key(owner_id, generation, retired_dek)
+        _remember_key(owner_id, int(get_meta(_generation_meta_name(owner_id), 1)), dek)
+        return dek
+
+# 🔓 Abrir la bóveda desde el secreto USB con los parámetros de KDF guardados
+def open_vault(secret: bytes, owner_id: str = "default", target_ms: int = KDF_TARGET_MS) -> bytes:
+    params = get_kdf_params(owner_id)
+    dek = unlock_vault(derive_key_with_params(secret, params or LEGACY_KDF), owner_id)
+    if params is None:
+        # 🧳 Primera apertura tras actualizar: sal propia y coste calibrado
+        retune_kdf(secret, owner_id, target_ms)
+    return dek
+
+# ⏱️ Recalibrar el KDF: solo se vuelven a envolver las DEKs con la nueva clave maestra
+def retune_kdf(secret: bytes, owner_id: str = "default", target_ms: int = KDF_TARGET_MS, algorithm: str = "scrypt"):
+    old_key = derive_key_with_params(secret, get_kdf_params(owner_id) or LEGACY_KDF)
+    params = calibrate_kdf(target_ms, algorithm)
+    new_key = derive_key_with_params(secret, params)
+    rotate_master_key(old_key, new_key, owner_id, kdf_params=params)
+
+# 🔒 Olvidar todas las claves desenvueltas (y lo cacheado a partir de ellas)
+def lock_vault():
+    _keyring.clear()
+    _key_generations.clear()
+    _key_owners.clear()
+    clear_cipher_cache()
+    invalidate_cache()
+
+# 🧳 Migración única: entradas cifradas con la clave maestra pasan a la DEK
+# La contraseña se abre en estricto y las notas no: notas dañadas → registro con notas vacías.
+# Una contraseña ilegible deja la fila intacta en UNREADABLE_GENERATION; el informe queda en vault_meta.
+def _migrate_to_envelope(master_key: bytes, owner_id: str) -> bytes:
+    dek = get_random_bytes(DEK_SIZE)
+    report = {"notes_lost": [], "unreadable": []}
+    migrated = 0
+    with transaction() as cursor:
+        last_id = 0
+        while True:
+            rows = cursor.execute(f"""
+                SELECT id, record, encrypted_password, encrypted_notes
+                FROM vault_entries
+                WHERE owner_ref = {OWNER_REF} AND id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (owner_id, last_id, REKEY_BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for entry_id, record, pw_blob, notes_blob in rows:
+                try:
+                    if record:
+                        secrets = open_record(master_key, record)
+                    else:
+                        secrets = {"password": decrypt_data(master_key, sanitize_blob(pw_blob)), "notes": ""}
+                except (ValueError, TypeError, UnicodeDecodeError):
+                    report["unreadable"].append(entry_id)
+                    continue
+                if not record and notes_blob:
+                    try:
+                        secrets["notes"] = decrypt_data(master_key, sanitize_blob(notes_blob))
+                    except (ValueError, TypeError, UnicodeDecodeError):
+                        report["notes_lost"].append(entry_id)
+                updates.append((seal_record(dek, secrets["password"], secrets["notes"]), entry_id))
+            cursor.executemany("""
+                UPDATE vault_entries
+                SET record = ?, encrypted_password = NULL, encrypted_notes = NULL
+                WHERE id = ?
+            """, updates)
+            migrated += len(updates)
+            last_id = rows[-1][0]
+
+        if report["unreadable"] and not migrated:
+            # 🔑 Ninguna fila se abre: la clave no es la de esta bóveda (rollback, nada cambia)
+            raise ValueError("❌ La clave USB no corresponde a esta bóveda.")
+        if report["unreadable"]:
+            cursor.executemany(
+                "UPDATE vault_entries SET key_generation = ? WHERE id = ?",
+                [(UNREADABLE_GENERATION, entry_id) for entry_id in report["unreadable"]]
+            )
+        if report["notes_lost"] or report["unreadable"]:
+            _set_meta(cursor, _envelope_report_meta_name(owner_id), json.dumps(report))
+            print(f"⚠️ Migración de claves: {len(report['notes_lost'])} entradas sin notas legibles, "
+                  f"{len(report['unreadable'])} ilegibles conservadas sin migrar")
 
-    nonce = encrypted[:16]
-    tag = encrypted[16:32]
-    ciphertext = encrypted[32:]
+        _set_meta(cursor, _dek_meta_name(owner_id), encrypt_bytes(master_key, dek))
+    return dek
 
-    cipher = AES.new(key, AES.MODE_EAX, nonce=nonce)
-    return cipher.decrypt_and_verify(ciphertext, tag).decode()
+# 🧳 Entradas que la migración a DEK no pudo migrar enteras (ids por tipo de problema)
+def envelope_migration_report(owner_id: str = "default") -> dict:
+    report = get_meta(_envelope_report_meta_name(owner_id))
+    return json.loads(report) if report else {"notes_lost": [], "unreadable": []}
 
 # 💾 Añadir entrada cifrada
+# ⚠️ Los errores (p. ej. sqlite3.IntegrityError por una entrada repetida) llegan al llamador
 def add_entry(key: bytes, service: str, username: str, password: str, notes: str = "", owner_id: str = "default"):
-    try:
-        encrypted_pw = encrypt_data(key, password)
-        if not notes or notes.strip() == "":
-            notes = " "  # 🧷 Valor mínimo para evitar errores de descifrado
-        encrypted_notes = encrypt_data(key, notes) if notes else b""
-        now = datetime.utcnow().isoformat()
-
-        assert isinstance(encrypted_pw, bytes), "encrypted_pw no es tipo bytes"
-        assert isinstance(encrypted_notes, bytes), "encrypted_notes no es tipo bytes"
+    now = int(time.time())
 
-        conn = sqlite3.connect(get_database_path())
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS vault_entries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                service TEXT NOT NULL,
-                username TEXT NOT NULL,
-                encrypted_password BLOB NOT NULL,
-                encrypted_notes BLOB,
-                created_at TEXT NOT NULL,
-                updated_at TEXT,
-                owner_id TEXT NOT NULL
-            )
-        """)
-
-        cursor.execute("""
+    with transaction() as cursor:
+        _ensure_owner(cursor, owner_id)
+        dek, generation = _write_key(cursor, key)
+        cursor.execute(f"""
             INSERT INTO vault_entries (
-                service, username, encrypted_password, encrypted_notes,
-                created_at, updated_at, owner_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                service, username, record, created_at, updated_at, owner_ref, key_generation
+            ) VALUES (?, ?, ?, ?, ?, {OWNER_REF}, ?)
         """, (
-            service, username, encrypted_pw, encrypted_notes,
-            now, now, owner_id
+            service, username, seal_record(dek, password, notes), now, now, owner_id, generation
         ))
 
-        conn.commit()
-
-    except Exception as e:
-        pass
-    finally:
-        conn.close()
-
 def sanitize_blob(blob):
     return bytes(blob) if not isinstance(blob, bytes) else blob
 
@@ -108,98 +496,176 @@ def safe_decrypt(blob, key: bytes) -> str:
     except Exception as e:
         return "❌ Error"
 
-# 📖 Leer entradas
-def get_entries(key: bytes, owner_id: str = "default"):
-    conn = sqlite3.connect(get_database_path())
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, service, username, encrypted_password, encrypted_notes, created_at
-        FROM vault_entries
-        WHERE owner_id = ?
-        ORDER BY created_at DESC
-    """, (owner_id,))
-    rows = cursor.fetchall()
-    conn.close()
-
-    entries = []
-    for row in rows:
-        entry_id = row[0]
-        service = row[1]
-        username = row[2]
-        pw_blob = row[3]
-        notes_blob = row[4]
-        created_at = row[5]
-        # 🧼 Sanitizar blobs cifrados
-        pw_blob = sanitize_blob(row[3])
-        notes_blob = sanitize_blob(row[4]) if row[4] else b""
-
-        # 🔍 Inspección visual antes de descifrar
-        inspect_encrypted_entry(entry_id, pw_blob, notes_blob)
-
-        # 🧼 Reconversión si no son bytes
-        if not isinstance(pw_blob, bytes):
-            pw_blob = sanitize_blob(row[3])
-
-        if notes_blob and not isinstance(notes_blob, bytes):
-            notes_blob = row[4]  # sin sanitizar, lo maneja safe_decrypt
-        # 🔓 Descifrado seguro
+# 🚿 Recorrer entradas por páginas con keyset (created_at, id): memoria constante
+# after: empezar tras ese cursor; until: parar en ese cursor (incluido)
+def iter_entries(owner_id: str = "default", after=None, limit: int = None,
+                 page_size: int = ENTRY_PAGE_SIZE, with_blobs: bool = False, until=None, db_path=None):
+    columns = "id, service, username, created_at, updated_at"
+    if with_blobs:
+        columns += ", record, encrypted_password, encrypted_notes, key_generation"
+
+    conn = get_connection(db_path)
+    remaining = limit
+    # 🧠 Solo la primera página del listado va a la caché: un recorrido completo no la llena
+    cacheable = not with_blobs and after is None and db_path is None
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        conditions = [f"owner_ref = {OWNER_REF}"]
+        params = [owner_id]
+        if after is not None:
+            conditions.append("(created_at, id) < (?, ?)")
+            params += [after[0], after[1]]
+        if until is not None:
+            conditions.append("(created_at, id) >= (?, ?)")
+            params += [until[0], until[1]]
+        query = f"""
+            SELECT {columns} FROM vault_entries
+            WHERE {" AND ".join(conditions)}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        """
+        params = tuple(params + [size])
+        if cacheable:
+            # 🧠 Se cachean las tuplas de la página: cada lector recibe diccionarios nuevos
+            rows = _read_through(("page", query, params), lambda: conn.execute(query, params).fetchall())
+            cacheable = False
+        else:
+            rows = conn.execute(query, params).fetchall()
+
+        for row in rows:
+            entry = {"id": row[0], "service": row[1], "username": row[2], "created_at": row[3], "updated_at": row[4]}
+            if with_blobs:
+                entry["record"] = sanitize_blob(row[5]) if row[5] else None
+                entry["encrypted_password"] = sanitize_blob(row[6]) if row[6] else None
+                entry["encrypted_notes"] = sanitize_blob(row[7]) if row[7] else b""
+                entry["key_generation"] = row[8]
+            yield entry
+
+        if len(rows) < size:
+            return
+        after = entry_cursor(rows[-1])
+        if remaining is not None:
+            remaining -= len(rows)
+
+# 📍 Cursor keyset de una entrada (para continuar la paginación tras ella)
+def entry_cursor(entry) -> tuple:
+    if isinstance(entry, dict):
+        return entry["created_at"], entry["id"]
+    return entry[3], entry[0]
+
+# 📋 Listar entradas sin descifrar (solo metadatos)
+def list_entries(owner_id: str = "default", after=None, limit: int = None):
+    return list(iter_entries(owner_id, after=after, limit=limit))
+
+# 🔓 Descifrar una sola entrada bajo demanda (mostrar o copiar)
+def decrypt_entry(key: bytes, entry_id: int) -> dict:
+    if ENTRY_CACHE_SECRETS:
+        return dict(_read_through(("secrets", key, entry_id), lambda: _decrypt_entry(key, entry_id)))
+    return _decrypt_entry(key, entry_id)
+
+def _decrypt_entry(key: bytes, entry_id: int) -> dict:
+    cursor = get_connection().execute("""
+        SELECT e.record, e.encrypted_password, e.encrypted_notes, o.owner_id, e.key_generation
+        FROM vault_entries e
+        JOIN vault_owners o ON o.id = e.owner_ref
+        WHERE e.id = ?
+    """, (entry_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise KeyError(f"❌ Entrada {entry_id} no encontrada")
+
+    return open_entry_secrets(key_for_generation(key, row[3], row[4]), row[0], row[1], row[2])
+
+# 🔓 Descifrar un bloque de filas (ejecutable en hilo o proceso)
+def _decrypt_chunk(items):
+    results = []
+    for key, record, pw_blob, notes_blob in items:
         try:
-
-            decrypted_pw = decrypt_data(key, pw_blob)
-            decrypted_notes = safe_decrypt(notes_blob, key)
-
-        except Exception as e:
-            decrypted_pw = "❌ Error"
-            decrypted_notes = "❌ Error"
-
-        entries.append({
-            "id": entry_id,
-            "service": service,
-            "username": username,
-            "encrypted_password": pw_blob,
-            "encrypted_notes": notes_blob,
-            "created_at": created_at,
-            "password": decrypted_pw,
-            "notes": decrypted_notes
-        })
-
-    return entries
-
-def repair_empty_notes_entries(db_path: str, key: bytes):
-    import sqlite3
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT id, encrypted_notes FROM entries")
-    entries = cursor.fetchall()
-
-    repaired = 0
-    for entry_id, blob in entries:
-        if not blob or not isinstance(blob, (bytes, bytearray)) or len(blob) < 32:
-            fixed_blob = encrypt_data(key, "-")
-            cursor.execute("UPDATE entries SET encrypted_notes = ? WHERE id = ?", (fixed_blob, entry_id))
-            repaired += 1
-
-    conn.commit()
-    conn.close()
+            secrets = open_entry_secrets(key, record, pw_blob, notes_blob, strict=True)
+            results.append({"password": secrets["password"], "notes": secrets["notes"], "error": None})
+        except (ValueError, TypeError, UnicodeDecodeError) as e:
+            results.append({"password": None, "notes": None, "error": str(e) or type(e).__name__})
+    return results
+
+def decrypt_executor(workers: int = None, processes: bool = False):
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    return pool(max_workers=workers or os.cpu_count())
+
+# 🔓 Descifrado por lotes: items (key, record, encrypted_password, encrypted_notes)
+# Devuelve un resultado por item en el mismo orden, con "error" propio si falla.
+def decrypt_batch(items, workers: int = None, executor=None, processes: bool = False,
+                  chunk_size: int = DECRYPT_CHUNK_SIZE) -> list:
+    items = list(items)
+    if executor is None and len(items) <= chunk_size:
+        return _decrypt_chunk(items)
+
+    chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+    own_executor = executor is None
+    if own_executor:
+        executor = decrypt_executor(workers, processes)
+    try:
+        results = []
+        for chunk_results in executor.map(_decrypt_chunk, chunks):
+            results.extend(chunk_results)
+        return results
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+# 📖 Leer entradas descifradas en streaming (cada página se descifra en paralelo)
+def iter_decrypted_entries(key: bytes, owner_id: str = "default", workers: int = None,
+                           executor=None, processes: bool = False, page_size: int = ENTRY_PAGE_SIZE):
+    own_executor = executor is None
+    if own_executor:
+        executor = decrypt_executor(workers, processes)
+    try:
+        page = []
+        for entry in iter_entries(owner_id, page_size=page_size, with_blobs=True):
+            page.append(entry)
+            if len(page) == page_size:
+                yield from _decrypt_page(key, owner_id, page, executor)
+                page = []
+        if page:
+            yield from _decrypt_page(key, owner_id, page, executor)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+def _decrypt_page(key: bytes, owner_id: str, page: list, executor):
+    items = [
+        (key_for_generation(key, owner_id, entry.pop("key_generation")),
+         entry["record"], entry["encrypted_password"], entry["encrypted_notes"])
+        for entry in page
+    ]
+    # 🧷 Lotes pequeños por trabajador para repartir la página entre todos los núcleos
+    chunk_size = max(1, min(DECRYPT_CHUNK_SIZE, -(-len(items) // (os.cpu_count() or 1))))
+    for entry, result in zip(page, decrypt_batch(items, executor=executor, chunk_size=chunk_size)):
+        entry.update(result)
+        yield entry
+
+# 📖 Leer entradas (las ilegibles llevan "error" y password/notes a None)
+def get_entries(key: bytes, owner_id: str = "default", workers: int = None, processes: bool = False):
+    load = lambda: list(iter_decrypted_entries(key, owner_id, workers=workers, processes=processes))
+    if not ENTRY_CACHE_SECRETS:
+        return load()
+    return [dict(entry) for entry in _read_through(("entries", key, owner_id), load)]
+
+# 🩹 Reparar notas vacías o dañadas (formato antiguo) con el motor de integridad
+def repair_empty_notes_entries(db_path: str, key: bytes, owner_id: str = "default") -> int:
+    from VaultIntegrity import verify_vault
+
+    return verify_vault(key, owner_id, repair=True, quick=True, db_path=db_path)["repaired"]
 
 # 🔄 Actualizar entrada
 def update_entry(entry_id, service, username, password, notes, key):
-    encrypted_password = encrypt_data(key, password)
-    if not notes or notes.strip() == "":
-        notes = " "  # 🧷 Valor mínimo para evitar errores de descifrado
-    encrypted_notes = encrypt_data(key, notes)
-
-    conn = sqlite3.connect(get_database_path())
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE vault_entries
-        SET service = ?, username = ?, encrypted_password = ?, encrypted_notes = ?, updated_at = datetime('now')
-        WHERE id = ?
-    """, (service, username, encrypted_password, encrypted_notes, entry_id))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        dek, generation = _write_key(cursor, key)
+        cursor.execute("""
+            UPDATE vault_entries
+            SET service = ?, username = ?, record = ?, encrypted_password = NULL, encrypted_notes = NULL,
+                key_generation = ?, updated_at = ?
+            WHERE id = ?
+        """, (service, username, seal_record(dek, password, notes), generation, int(time.time()), entry_id))
 
 def sanitize_blob(blob):
     if isinstance(blob, memoryview):
@@ -210,98 +676,327 @@ def sanitize_blob(blob):
         return bytes(blob)
     return blob
 
+# 📦 Insertar muchas entradas en una sola transacción (todo o nada)
+def add_entries(key: bytes, entries, owner_id: str = "default", progress=None) -> int:
+    total = len(entries) if hasattr(entries, "__len__") else None
+    done = 0
+
+    # 🔁 El cifrado se intercala con executemany: no se materializa la lista cifrada
+    def encrypted_rows(dek, generation):
+        nonlocal done
+        now = int(time.time())
+        for entry in entries:
+            yield (
+                entry["service"], entry["username"],
+                seal_record(dek, entry["password"], entry.get("notes")),
+                now, now, owner_id, generation
+            )
+            done += 1
+            if progress:
+                progress(done, total)
+
+    with transaction() as cursor:
+        _ensure_owner(cursor, owner_id)
+        cursor.executemany(f"""
+            INSERT INTO vault_entries (
+                service, username, record, created_at, updated_at, owner_ref, key_generation
+            ) VALUES (?, ?, ?, ?, ?, {OWNER_REF}, ?)
+        """, encrypted_rows(*_write_key(cursor, key)))
+    return done
+
+# 📦 Actualizar muchas entradas en una sola transacción (todo o nada)
+def update_entries(key: bytes, updates, progress=None) -> int:
+    total = len(updates) if hasattr(updates, "__len__") else None
+    done = 0
+
+    def encrypted_rows(dek, generation):
+        nonlocal done
+        now = int(time.time())
+        for entry in updates:
+            yield (
+                entry["service"], entry["username"],
+                seal_record(dek, entry["password"], entry.get("notes")),
+                generation, now, entry["id"]
+            )
+            done += 1
+            if progress:
+                progress(done, total)
+
+    with transaction() as cursor:
+        cursor.executemany("""
+            UPDATE vault_entries
+            SET service = ?, username = ?, record = ?, encrypted_password = NULL, encrypted_notes = NULL,
+                key_generation = ?, updated_at = ?
+            WHERE id = ?
+        """, encrypted_rows(*_write_key(cursor, key)))
+    return done
+
 # 🗑️ Eliminar entrada
 def delete_entry(entry_id: int):
-    conn = sqlite3.connect(get_database_path())
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM vault_entries WHERE id = ?", (entry_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM vault_entries WHERE id = ?", (entry_id,))
 
 # 🔍 Verificar existencia
-def entry_exists(service: str, username: str) -> bool:
-    conn = sqlite3.connect(get_database_path())
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM vault_entries WHERE service=? AND username=?", (service, username))
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count > 0
+def entry_exists(service: str, username: str, owner_id: str = None) -> bool:
+    if owner_id is None:
+        cursor = get_connection().execute(
+            "SELECT EXISTS(SELECT 1 FROM vault_entries WHERE service=? AND username=?)", (service, username)
+        )
+    else:
+        cursor = get_connection().execute(
+            f"SELECT EXISTS(SELECT 1 FROM vault_entries WHERE owner_ref={OWNER_REF} AND service=? AND username=?)",
+            (owner_id, service, username)
+        )
+    return bool(cursor.fetchone()[0])
+
+# 💾 Insertar o sobrescribir la entrada (propietario, service, username)
+# Sin ON CONFLICT: el índice único puede faltar en bóvedas con duplicados antiguos;
+# en ese caso se sobrescribe la más reciente.
+def upsert_entry(key: bytes, service: str, username: str, password: str, notes: str = "", owner_id: str = "default"):
+    now = int(time.time())
+    with transaction() as cursor:
+        _ensure_owner(cursor, owner_id)
+        dek, generation = _write_key(cursor, key)
+        record = seal_record(dek, password, notes)
+        cursor.execute(f"""
+            UPDATE vault_entries
+            SET record = ?, encrypted_password = NULL, encrypted_notes = NULL, key_generation = ?, updated_at = ?
+            WHERE id = (
+                SELECT id FROM vault_entries
+                WHERE owner_ref = {OWNER_REF} AND service = ? AND username = ?
+                ORDER BY id DESC
+                LIMIT 1
+            )
+        """, (record, generation, now, owner_id, service, username))
+        if cursor.rowcount == 0:
+            cursor.execute(f"""
+                INSERT INTO vault_entries (
+                    service, username, record, created_at, updated_at, owner_ref, key_generation
+                ) VALUES (?, ?, ?, ?, ?, {OWNER_REF}, ?)
+            """, (service, username, record, now, now, owner_id, generation))
+
+# 📊 Estadísticas sin criptografía: solo columnas en claro y PRAGMAs
+def count_entries(owner_id: str = "default", db_path=None) -> int:
+    return get_connection(db_path).execute(
+        f"SELECT COUNT(*) FROM vault_entries WHERE owner_ref = {OWNER_REF}", (owner_id,)
+    ).fetchone()[0]
+
+# 📊 Pares (servicio, usuario) repetidos sin distinguir mayúsculas
+def find_duplicates(owner_id: str = "default") -> list:
+    rows = get_connection().execute(f"""
+        SELECT lower(service), lower(username), COUNT(*), group_concat(id)
+        FROM vault_entries
+        WHERE owner_ref = {OWNER_REF}
+        GROUP BY lower(service), lower(username)
+        HAVING COUNT(*) > 1
+        ORDER BY COUNT(*) DESC, lower(service), lower(username)
+    """, (owner_id,)).fetchall()
+    return [
+        {"service": service, "username": username, "count": count, "ids": [int(i) for i in ids.split(",")]}
+        for service, username, count, ids in rows
+    ]
+
+# 📊 Reparto de entradas por antigüedad (created_at en epoch)
+def age_distribution(owner_id: str = "default", now: int = None) -> dict:
+    now = int(time.time()) if now is None else now
+    cases = []
+    params = []
+    for label, days in AGE_BUCKETS:
+        if days is None:
+            cases.append("ELSE ?")
+            params.append(label)
+        else:
+            cases.append("WHEN ? - created_at < ? THEN ?")
+            params += [now, days * 86400, label]
+    rows = get_connection().execute(f"""
+        SELECT CASE {" ".join(cases)} END AS bucket, COUNT(*)
+        FROM vault_entries
+        WHERE owner_ref = {OWNER_REF}
+        GROUP BY bucket
+    """, (*params, owner_id)).fetchall()
+    counts = dict(rows)
+    return {label: counts.get(label, 0) for label, _ in AGE_BUCKETS}
+
+# 📊 Tamaño y ocupación del fichero de la base
+def storage_stats(db_path=None) -> dict:
+    conn = get_connection(db_path)
+    path = Path(db_path or get_database_path())
+    wal = path.with_name(path.name + "-wal")
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {
+        "file_size": path.stat().st_size if path.exists() else 0,
+        "wal_size": wal.stat().st_size if wal.exists() else 0,
+        "page_size": page_size,
+        "page_count": page_count,
+        "freelist_count": freelist_count,
+        "free_bytes": freelist_count * page_size
+    }
+
+# 📊 Resumen para diagnóstico (cacheado hasta el siguiente cambio en la base)
+def get_vault_stats(owner_id: str = "default") -> dict:
+    def load():
+        return {
+            "entries": count_entries(owner_id),
+            "duplicates": find_duplicates(owner_id),
+            "age": age_distribution(owner_id),
+            "storage": storage_stats()
+        }
+    return _read_through(("stats", owner_id), load)
 
 def decrypt_field(blob: bytes, key: bytes) -> str:
     return decrypt_data(key, blob)
 
-# 🔄 Rotar clave maestra
-def rotate_master_key(old_key: bytes, new_key: bytes):
-    conn = sqlite3.connect(get_database_path())
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, encrypted_password, encrypted_notes FROM vault_entries")
-    rows = cursor.fetchall()
-
-    for row in rows:
-        entry_id = row[0]
-        old_pw = decrypt_data(old_key, row[1])
-        old_notes = decrypt_data(old_key, row[2]) if row[2] else ""
-
-        new_pw = encrypt_data(new_key, old_pw)
-        new_notes = encrypt_data(new_key, old_notes)
+# 🔄 Rotar clave maestra: solo se vuelven a envolver las DEKs (O(1))
+def rotate_master_key(old_key: bytes, new_key: bytes, owner_id: str = "default", kdf_params: dict = None):
+    dek = unlock_vault(old_key, owner_id)
+    retired = [(gen, decrypt_bytes(old_key, blob)) for gen, blob in _retired_keys(owner_id)]
+    with transaction() as cursor:
+        _set_meta(cursor, _dek_meta_name(owner_id), encrypt_bytes(new_key, dek))
+        for generation, retired_dek in retired:
+            _set_meta(cursor, _retired_dek_meta_name(owner_id, generation), encrypt_bytes(new_key, retired_dek))
+        if kdf_params is not None:
+            _set_meta(cursor, _kdf_meta_name(owner_id), json.dumps(kdf_params))
+
+# ♻️ Re-cifrar una fila con la DEK nueva (ejecutable en hilo o proceso)
+# Las filas antiguas de dos blobs salen ya en formato de registro compacto.
+def _reencrypt_row(task):
+    entry_id, record, pw_blob, notes_blob, old_generation, old_key, new_key = task
+    try:
+        secrets = open_entry_secrets(old_key, record, pw_blob, notes_blob, strict=True)
+    except (ValueError, TypeError, UnicodeDecodeError) as e:
+        return entry_id, None, old_generation, str(e)
+    return entry_id, seal_record(new_key, secrets["password"], secrets["notes"]), old_generation, None
+
+# ♻️ Iniciar rotación: la DEK actual pasa a retirada y se activa una nueva generación
+def _begin_reencryption(master_key: bytes, owner_id: str) -> tuple:
+    generation = int(get_meta(_generation_meta_name(owner_id), 1))
+    wrapped = get_meta(_dek_meta_name(owner_id))
+    new_dek = get_random_bytes(DEK_SIZE)
+    # 🗝️ En el llavero antes del commit: los escritores la encuentran en cuanto la generación cambia
+    _remember_key(owner_id, generation + 1, new_dek)
+    with transaction() as cursor:
+        _set_meta(cursor, _retired_dek_meta_name(owner_id, generation), wrapped)
+        _set_meta(cursor, _dek_meta_name(owner_id), encrypt_bytes(master_key, new_dek))
+        _set_meta(cursor, _generation_meta_name(owner_id), generation + 1)
+        _set_meta(cursor, _checkpoint_meta_name(owner_id), 0)
+    return new_dek, generation + 1
+
+# ♻️ Cerrar rotación: borrar el checkpoint y las claves retiradas sin filas
+def _finish_reencryption(owner_id: str):
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM vault_meta WHERE name = ?", (_checkpoint_meta_name(owner_id),))
+        for generation, _ in _retired_keys(owner_id):
+            in_use = cursor.execute(
+                f"SELECT 1 FROM vault_entries WHERE owner_ref = {OWNER_REF} AND key_generation = ? LIMIT 1",
+                (owner_id, generation)
+            ).fetchone()
+            if not in_use:
+                cursor.execute(
+                    "DELETE FROM vault_meta WHERE name = ?", (_retired_dek_meta_name(owner_id, generation),)
+                )
+
+# ♻️ Re-cifrado completo con una DEK nueva: por bloques, en paralelo y reanudable
+def reencrypt_vault(master_key: bytes, owner_id: str = "default", chunk_size: int = REKEY_BATCH_SIZE,
+                    workers: int = None, executor=None, progress=None) -> dict:
+    unlock_vault(master_key, owner_id)
+    checkpoint = get_meta(_checkpoint_meta_name(owner_id))
+    if checkpoint is None:
+        new_dek, generation = _begin_reencryption(master_key, owner_id)
+        last_id = 0
+    else:
+        # ⏯️ Rotación interrumpida: continuar desde el último bloque confirmado
+        generation = int(get_meta(_generation_meta_name(owner_id), 1))
+        new_dek = _keyring[(owner_id, generation)]
+        last_id = int(checkpoint)
+
+    conn = get_connection()
+    total = conn.execute(
+        f"SELECT COUNT(*) FROM vault_entries WHERE owner_ref = {OWNER_REF} AND id > ? AND key_generation <> ?",
+        (owner_id, last_id, generation)
+    ).fetchone()[0]
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+
+    done = 0
+    failed = []
+    try:
+        while True:
+            rows = conn.execute(f"""
+                SELECT id, record, encrypted_password, encrypted_notes, key_generation
+                FROM vault_entries
+                WHERE owner_ref = {OWNER_REF} AND id > ? AND key_generation <> ?
+                ORDER BY id
+                LIMIT ?
+            """, (owner_id, last_id, generation, chunk_size)).fetchall()
+            if not rows:
+                break
+
+            tasks = []
+            for entry_id, record, pw_blob, notes_blob, old_generation in rows:
+                old_key = _keyring.get((owner_id, old_generation))
+                if old_generation == UNREADABLE_GENERATION:
+                    failed.append({"id": entry_id, "error": "Ilegible desde la migración a DEK"})
+                    continue
+                if old_key is None:
+                    failed.append({"id": entry_id, "error": f"DEK de generación {old_generation} no disponible"})
+                    continue
+                tasks.append((
+                    entry_id, sanitize_blob(record) if record else None,
+                    sanitize_blob(pw_blob) if pw_blob else None, sanitize_blob(notes_blob) if notes_blob else None,
+                    old_generation, old_key, new_dek
+                ))
+
+            updates = []
+            for entry_id, new_record, old_generation, error in executor.map(_reencrypt_row, tasks):
+                if error:
+                    failed.append({"id": entry_id, "error": error})
+                else:
+                    # 🛡️ Solo si nadie reescribió la fila mientras tanto
+                    updates.append((new_record, generation, entry_id, old_generation))
+
+            last_id = rows[-1][0]
+            with transaction() as cursor:
+                cursor.executemany("""
+                    UPDATE vault_entries
+                    SET record = ?, encrypted_password = NULL, encrypted_notes = NULL, key_generation = ?
+                    WHERE id = ? AND key_generation = ?
+                """, updates)
+                _set_meta(cursor, _checkpoint_meta_name(owner_id), last_id)
+
+            done += len(rows)
+            if progress:
+                progress(done, total)
+    finally:
+        if own_executor:
+            executor.shutdown()
 
-        cursor.execute("""
-            UPDATE vault_entries
-            SET encrypted_password = ?, encrypted_notes = ?, updated_at = datetime('now')
-            WHERE id = ?
-        """, (new_pw, new_notes, entry_id))
+    _finish_reencryption(owner_id)
+    return {"key": new_dek, "generation": generation, "reencrypted": done - len(failed), "failed": failed}
 
-    conn.commit()
-    conn.close()
+# 🚪 Cierre de sesión o salida de la aplicación: claves, cachés y conexiones fuera de memoria
+def end_session():
+    lock_vault()
+    close_connections()
 
 # 🧯 Copia de seguridad
 def backup_database():
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_path = VAULTION_HOME / f"vaultion_backup_{timestamp}.db"
-    shutil.copy(DB_PATH, backup_path)
-
-def inspect_encrypted_entry(entry_id: int, encrypted_pw: bytes, encrypted_notes: bytes = b""):
-
-    def inspect_blob(label: str, blob: bytes):
-
-        if not isinstance(blob, bytes):
-            return
-
-        if len(blob) < 32:
-            return
-
-        nonce = blob[:16]
-        tag = blob[16:32]
-        ciphertext = blob[32:]
-
-
-    inspect_blob("Contraseña cifrada", encrypted_pw)
-    if encrypted_notes:
-        inspect_blob("Notas cifradas", encrypted_notes)
-    else:
-        pass
-
+    # 📸 API de backup de SQLite: incluye lo pendiente en el WAL
+    target = sqlite3.connect(backup_path)
+    try:
+        get_connection(DB_PATH).backup(target)
+    finally:
+        target.close()
 
 # 🧱 Inicializar base de datos
 def initialize_database(db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # ✅ Crear tabla solo si no existe
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS vault_entries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            service TEXT NOT NULL,
-            username TEXT NOT NULL,
-            encrypted_password BLOB NOT NULL,
-            encrypted_notes BLOB,
-            created_at TEXT NOT NULL,
-            updated_at TEXT,
-            owner_id TEXT NOT NULL
-        )
-    """)
-    conn.commit()
-    conn.close()
+    # ✅ El esquema se crea una sola vez al abrir la conexión del pool
+    get_connection(db_path)
 
 
 
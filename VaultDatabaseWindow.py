@@ -3,11 +3,13 @@
 # Juan Arnau
  
 from PySide6.QtWidgets import (
-    QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem,
-    QPushButton, QHBoxLayout, QMessageBox, QAbstractItemView, QDialog, QTableWidgetItem, QHeaderView
+    QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QTableView,
+    QPushButton, QHBoxLayout, QMessageBox, QAbstractItemView, QDialog, QHeaderView,
+    QApplication
 )
 from PySide6.QtCore import Qt
-from VaultDBManager import get_entries, delete_entry, update_entry, decrypt_field
+from VaultDBManager import delete_entry, update_entries, decrypt_field, open_record, invalidate_cache
+from VaultTableModel import VaultEntriesModel, EntryActionsDelegate, COL_ACTIONS
 import hashlib
 from AddEntryDialog import AddEntryDialog
 
@@ -45,69 +47,64 @@ class VaultDatabaseWindow(QWidget):
         #button_bar.addWidget(self.btn_delete_selected)
         layout.addLayout(button_bar)
 
-        self.table = QTableWidget()
-        self.table.setColumnCount(6)
-        self.table.setHorizontalHeaderLabels(["Servicio", "Usuario", "Contraseña", "Notas", "Creado", "Acciones"])
+        # 📋 Vista virtualizada: páginas bajo demanda y acciones pintadas por delegado
+        self.model = VaultEntriesModel(self.key, self.owner_id, parent=self)
+        self.model.load_failed.connect(self.on_entries_failed)
+
+        self.actions_delegate = EntryActionsDelegate(self)
+        self.actions_delegate.copy_requested.connect(self.copy_password)
+        self.actions_delegate.delete_requested.connect(self.delete_entry)
+
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setItemDelegateForColumn(COL_ACTIONS, self.actions_delegate)
         self.table.setStyleSheet("background-color: #2e2e2e;")
         self.table.setEditTriggers(QAbstractItemView.DoubleClicked)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.verticalHeader().setDefaultSectionSize(28)
+        # 🔓 Descifrar la fila justo antes de editarla (doubleClicked llega antes que el editor)
+        self.table.doubleClicked.connect(lambda index: self.reveal_row(index.row()))
         layout.addWidget(self.table)
 
         self.setLayout(layout)
         self.load_entries()
 
+    # 🔄 Refresco incremental: solo cambian las filas afectadas
     def load_entries(self):
-        self.table.setRowCount(0)
-        try:
-            entries = get_entries(self.key, owner_id=self.owner_id)
-
-            for i, entry in enumerate(entries):
-                self.table.insertRow(i)
-                try:
-                    if not isinstance(entry["encrypted_password"], bytes):
-                        raise TypeError("Campo 'encrypted_password' no es bytes")
-                    if not isinstance(entry["encrypted_notes"], bytes):
-                        raise TypeError("Campo 'encrypted_notes' no es bytes")
-
-                    decrypted_password = decrypt_field(entry["encrypted_password"], self.key)
-                    decrypted_notes = decrypt_field(entry["encrypted_notes"], self.key)
-                except Exception as e:
-                    decrypted_password = "❌ Error"
-                    decrypted_notes = "❌ Error"
-                    print(f"⚠️ Error al descifrar entrada {entry.get('id')}: {e}")
-                    QMessageBox.warning(self, "Error de descifrado",
-                        f"No se pudo descifrar la entrada ID {entry.get('id')} ({entry.get('service')}):\n{e}")
+        self.model.refresh()
 
-                service_item = QTableWidgetItem(entry["service"])
-                username_item = QTableWidgetItem(entry["username"])
-                password_item = QTableWidgetItem(decrypted_password)
-                notes_item = QTableWidgetItem(decrypted_notes)
-                created_item = QTableWidgetItem(entry["created_at"])
+    # 🧹 Al cerrar: soltar lo descifrado en el modelo y lo cacheado
+    # (las DEKs siguen en el llavero mientras la pantalla principal esté abierta)
+    def closeEvent(self, event):
+        self.model.secrets.clear()
+        self.model.revealed.clear()
+        invalidate_cache()
+        super().closeEvent(event)
 
-                service_item.setData(Qt.UserRole, entry["id"])
+    def on_entries_failed(self, error):
+        print(f"❌ Error global al abrir la base de datos: {error}")
+        QMessageBox.critical(self, "Error", f"No se pudo abrir la base de datos:\n{error}")
 
-                self.table.setItem(i, 0, service_item)
-                self.table.setItem(i, 1, username_item)
-                self.table.setItem(i, 2, password_item)
-                self.table.setItem(i, 3, notes_item)
-                self.table.setItem(i, 4, created_item)
-
-                btn_delete = QPushButton("🗑️")
-                btn_delete.clicked.connect(lambda _, eid=entry["id"]: self.delete_entry(eid))
-
-                action_layout = QHBoxLayout()
-                action_layout.setContentsMargins(0, 0, 0, 0)
-                action_layout.addWidget(btn_delete)
-
-                action_widget = QWidget()
-                action_widget.setLayout(action_layout)
-                self.table.setCellWidget(i, 5, action_widget)
+    def entry_id_at(self, row):
+        return self.model.entry_id(row)
 
+    def reveal_row(self, row, column=None):
+        try:
+            self.model.reveal(row)
         except Exception as e:
-            import traceback
-            print("❌ Error global al abrir la base de datos:")
-            traceback.print_exc()  # ✅ Esto imprime el stack completo
-            QMessageBox.critical(self, "Error", f"No se pudo abrir la base de datos:\n{e}")
+            entry_id = self.entry_id_at(row)
+            print(f"⚠️ Error al descifrar entrada {entry_id}: {e}")
+            QMessageBox.warning(self, "Error de descifrado",
+                f"No se pudo descifrar la entrada ID {entry_id}:\n{e}")
 
+    def copy_password(self, entry_id):
+        try:
+            password = self.model.value(entry_id, "password")
+        except Exception as e:
+            QMessageBox.warning(self, "Error de descifrado",
+                f"No se pudo descifrar la entrada ID {entry_id}:\n{e}")
+            return
+        QApplication.clipboard().setText(password)
 
     def delete_entry(self, entry_id):
         confirm = QMessageBox.question(self, "Confirmar eliminación", "¿Eliminar esta entrada?", QMessageBox.Yes | QMessageBox.No)
@@ -116,13 +113,12 @@ class VaultDatabaseWindow(QWidget):
             self.load_entries()
 
     def delete_selected(self):
-        selected = self.table.currentRow()
+        selected = self.table.currentIndex().row()
         if selected == -1:
             QMessageBox.warning(self, "Sin selección", "Selecciona una fila para eliminar.")
             return
-        item = self.table.item(selected, 0)
-        if item:
-            entry_id = item.data(Qt.UserRole)
+        entry_id = self.entry_id_at(selected)
+        if entry_id is not None:
             self.delete_entry(entry_id)
 
     def add_entry(self):
@@ -131,48 +127,17 @@ class VaultDatabaseWindow(QWidget):
 
             self.load_entries()
 
-    def handle_cell_edit(self, row, column):
-        try:
-            def safe_text(r, c):
-                item = self.table.item(r, c)
-                return item.text() if item else ""
-
-            service = safe_text(row, 0)
-            username = safe_text(row, 1)
-            password = safe_text(row, 2)
-            notes = safe_text(row, 3)
-
-            id_item = self.table.item(row, 0)
-            entry_id = id_item.data(Qt.UserRole) if id_item else None
-
-            if entry_id is None:
-                raise ValueError("ID de entrada no disponible")
-
-            update_entry(entry_id, service, username, password, notes, self.key)
-            print(f"✅ Entrada {entry_id} actualizada.")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"No se pudo guardar el cambio:\n{e}")
-
     def save_changes(self):
-        try:
-            for row in range(self.table.rowCount()):
-                def safe_text(col):
-                    item = self.table.item(row, col)
-                    return item.text() if item else ""
-
-                service = safe_text(0)
-                username = safe_text(1)
-                password = safe_text(2)
-                notes = safe_text(3)
-
-                id_item = self.table.item(row, 0)
-                entry_id = id_item.data(Qt.UserRole) if id_item else None
-                if entry_id is None:
-                    continue
+        if not self.model.has_changes():
+            QMessageBox.information(self, "Sin cambios", "No hay ediciones pendientes de guardar.")
+            return
 
-                update_entry(entry_id, service, username, password, notes, self.key)
+        try:
+            # 💾 Solo las filas editadas, en un único commit
+            saved = update_entries(self.key, self.model.pending_updates())
+            self.model.clear_edits()
 
-            QMessageBox.information(self, "✅ Cambios guardados", "Todas las ediciones han sido guardadas correctamente.")
+            QMessageBox.information(self, "✅ Cambios guardados", f"Se han guardado {saved} entradas modificadas.")
             self.load_entries()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"No se pudo guardar los cambios:\n{e}")
@@ -186,6 +151,16 @@ class VaultDatabaseWindow(QWidget):
             if eid is None or not isinstance(eid, int):
                 errores.append({"id": eid, "service": service, "error": "ID inválido o ausente"})
 
+            # 📦 Registro compacto: un solo sello con contraseña y notas
+            if entry.get("record"):
+                try:
+                    _ = open_record(self.key, entry["record"])
+                except Exception as e:
+                    errores.append({"id": eid, "service": service, "error": f"Error al descifrar: {e}"})
+                if "created_at" not in entry:
+                    errores.append({"id": eid, "service": service, "error": "Falta 'created_at'"})
+                continue
+
             if "encrypted_password" not in entry:
                 errores.append({"id": eid, "service": service, "error": "Falta 'encrypted_password'"})
             elif not isinstance(entry["encrypted_password"], bytes):
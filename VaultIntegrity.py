@@ -0,0 +1,176 @@
+# Copyright © 2025 Juan Arnau
+# Licencia de uso restringido – ver LICENSE.txt
+# Juan Arnau
+
+import os
+import json
+import time
+from datetime import datetime
+from VaultCiphers import CIPHER_SUITES
+from VaultDBManager import (
+    get_connection, transaction, iter_entries, count_entries, key_for_generation, decrypt_executor,
+    open_record, decrypt_data, seal_record, VAULTION_HOME
+)
+
+VERIFY_CHUNK_SIZE = 256
+VERIFY_PAGE_SIZE = 4096
+LEGACY_BLOB_MIN_SIZE = 32  # nonce(16) + tag(16)
+
+# 🔍 Comprobar un bloque de filas (ejecutable en hilo o proceso)
+# Cada item: (id, key, record, encrypted_password, encrypted_notes, reparar)
+# Devuelve (id, problemas, registro reparado o None). El texto en claro no sale de aquí.
+def _verify_chunk(items):
+    results = []
+    for entry_id, key, record, pw_blob, notes_blob, repair in items:
+        problems = []
+        fixed = None
+
+        if record:
+            if record[0] not in CIPHER_SUITES:
+                problems.append(f"Suite de cifrado desconocida: {record[0]}")
+            else:
+                try:
+                    open_record(key, record)
+                except (ValueError, TypeError, UnicodeDecodeError) as e:
+                    problems.append(f"Registro: etiqueta AEAD inválida ({e})")
+            results.append((entry_id, problems, fixed))
+            continue
+
+        # 🧳 Formato antiguo: dos blobs EAX independientes
+        password = None
+        if not pw_blob or len(pw_blob) < LEGACY_BLOB_MIN_SIZE:
+            problems.append("Contraseña ausente o truncada")
+        else:
+            try:
+                password = decrypt_data(key, pw_blob)
+            except (ValueError, TypeError, UnicodeDecodeError) as e:
+                problems.append(f"Contraseña: etiqueta AEAD inválida ({e})")
+
+        notes_broken = False
+        if not notes_blob:
+            problems.append("Notas vacías")
+            notes_broken = True
+        elif len(notes_blob) < LEGACY_BLOB_MIN_SIZE:
+            problems.append("Notas truncadas")
+            notes_broken = True
+        else:
+            try:
+                decrypt_data(key, notes_blob)
+            except (ValueError, TypeError, UnicodeDecodeError) as e:
+                problems.append(f"Notas: etiqueta AEAD inválida ({e})")
+                notes_broken = True
+
+        # 🩹 Reparable si la contraseña es legible: se reescribe como registro compacto sin notas
+        if repair and notes_broken and password is not None:
+            fixed = seal_record(key, password, "")
+        results.append((entry_id, problems, fixed))
+    return results
+
+# 🧱 PRAGMA integrity_check (o quick_check): ["ok"] si la base está sana
+def check_sqlite_integrity(quick: bool = False, db_path=None) -> list:
+    pragma = "quick_check" if quick else "integrity_check"
+    return [row[0] for row in get_connection(db_path).execute(f"PRAGMA {pragma}")]
+
+# 🛡️ Verificación completa: estructura y etiqueta AEAD de cada fila, en paralelo y por páginas
+# Con repair=True las filas reparables se corrigen todas en una sola transacción.
+# db_path=None usa la base de la sesión.
+def verify_vault(key: bytes, owner_id: str = "default", repair: bool = False, workers: int = None,
+                 executor=None, processes: bool = False, quick: bool = False,
+                 chunk_size: int = VERIFY_CHUNK_SIZE, page_size: int = VERIFY_PAGE_SIZE, progress=None,
+                 db_path=None) -> dict:
+    started = time.time()
+    report = {
+        "owner_id": owner_id,
+        "started_at": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+        "sqlite_integrity": check_sqlite_integrity(quick, db_path),
+        "checked": 0,
+        "ok": 0,
+        "issues": [],
+        "repairable": 0,
+        "repaired": 0
+    }
+    total = count_entries(owner_id, db_path)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = decrypt_executor(workers, processes)
+
+    repairs = []
+
+    def verify_page(page):
+        _verify_page(key, owner_id, page, repair, executor, chunk_size, report, repairs)
+        if progress:
+            progress(report["checked"], total)
+
+    try:
+        page = []
+        for entry in iter_entries(owner_id, page_size=page_size, with_blobs=True, db_path=db_path):
+            page.append(entry)
+            if len(page) == page_size:
+                verify_page(page)
+                page = []
+        if page:
+            verify_page(page)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    if repairs:
+        now = int(time.time())
+        with transaction(db_path) as cursor:
+            cursor.executemany("""
+                UPDATE vault_entries
+                SET record = ?, encrypted_password = NULL, encrypted_notes = NULL, updated_at = ?
+                WHERE id = ?
+            """, [(fixed, now, entry_id) for entry_id, fixed in repairs])
+        report["repaired"] = len(repairs)
+        repaired_ids = {entry_id for entry_id, _ in repairs}
+        for issue in report["issues"]:
+            issue["repaired"] = issue["id"] in repaired_ids
+
+    report["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    report["duration_s"] = round(time.time() - started, 3)
+    return report
+
+def _verify_page(key, owner_id, page, repair, executor, chunk_size, report, repairs):
+    items = [
+        (entry["id"], key_for_generation(key, owner_id, entry["key_generation"]),
+         entry["record"], entry["encrypted_password"], entry["encrypted_notes"], repair)
+        for entry in page
+    ]
+    chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+    by_id = {entry["id"]: entry for entry in page}
+
+    for results in executor.map(_verify_chunk, chunks):
+        for entry_id, problems, fixed in results:
+            report["checked"] += 1
+            entry = by_id[entry_id]
+            if not entry["created_at"]:
+                problems.append("Falta 'created_at'")
+            if not problems:
+                report["ok"] += 1
+                continue
+            report["issues"].append({
+                "id": entry_id,
+                "service": entry["service"],
+                "username": entry["username"],
+                "problems": problems,
+                "repairable": fixed is not None or (not repair and _is_repairable(problems))
+            })
+            if fixed is not None:
+                repairs.append((entry_id, fixed))
+    report["repairable"] = sum(1 for issue in report["issues"] if issue["repairable"])
+
+# 🩹 Sin reparar aún: solo las notas rotas con la contraseña intacta tienen arreglo
+def _is_repairable(problems) -> bool:
+    notes_only = all(p.startswith("Notas") or p == "Falta 'created_at'" for p in problems)
+    return notes_only and any(p.startswith("Notas") for p in problems)
+
+# 💾 Guardar el informe en JSON (legible por máquina)
+def write_report(report: dict, path=None) -> str:
+    if path is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = VAULTION_HOME / f"integrity_report_{timestamp}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return os.fspath(path)
@@ -0,0 +1,194 @@
+# Copyright © 2025 Juan Arnau
+# Licencia de uso restringido – ver LICENSE.txt
+# Juan Arnau
+
+import inspect
+import sqlite3
+
+MIGRATION_BATCH_SIZE = 500
+
+# 🧱 v1: esquema base (antes duplicado en add_entry e initialize_database)
+def _base_schema(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vault_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            service TEXT NOT NULL,
+            username TEXT NOT NULL,
+            encrypted_password BLOB NOT NULL,
+            encrypted_notes BLOB,
+            created_at TEXT NOT NULL,
+            updated_at TEXT,
+            owner_id TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vault_meta (
+            name TEXT PRIMARY KEY,
+            value BLOB
+        )
+    """)
+
+# 🧬 v2: generación de la DEK que cifró cada fila
+def _key_generation_column(conn: sqlite3.Connection):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(vault_entries)")}
+    if "key_generation" not in columns:
+        conn.execute("ALTER TABLE vault_entries ADD COLUMN key_generation INTEGER NOT NULL DEFAULT 1")
+
+# ⚡ v3: índices para el listado por propietario y la búsqueda por servicio/usuario
+def _hot_path_indexes(conn: sqlite3.Connection):
+    # 📋 Cubre iter_entries: filtro, orden keyset y columnas de metadatos sin tocar la tabla
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vault_entries_owner_created
+        ON vault_entries (owner_id, created_at, id, service, username)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vault_entries_service_username
+        ON vault_entries (service, username)
+    """)
+
+# 🔑 Índice único (propietario, servicio, usuario): solo si no hay duplicados exactos.
+# Nunca se tocan las filas: los duplicados los muestra el escaneo de diagnóstico y,
+# cuando el usuario los resuelve, el índice se crea al abrir la base la próxima vez.
+UNIQUE_INDEX_NAME = "idx_vault_entries_owner_service_username"
+
+def _create_unique_index(conn: sqlite3.Connection, owner_column: str) -> bool:
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (UNIQUE_INDEX_NAME,)).fetchone():
+        return True
+    duplicated = conn.execute(f"""
+        SELECT 1 FROM vault_entries
+        GROUP BY {owner_column}, service, username
+        HAVING COUNT(*) > 1
+        LIMIT 1
+    """).fetchone()
+    if duplicated:
+        return False
+    conn.execute(f"""
+        CREATE UNIQUE INDEX {UNIQUE_INDEX_NAME}
+        ON vault_entries ({owner_column}, service, username)
+    """)
+    return True
+
+# 🔑 Crear el índice único si ya es posible (esquema actual, fuera de las migraciones)
+def ensure_unique_index(conn: sqlite3.Connection) -> bool:
+    with conn:
+        return _create_unique_index(conn, "owner_ref")
+
+# 🔑 v4: unicidad (owner_id, service, username) para upserts
+def _unique_owner_service_username(conn: sqlite3.Connection):
+    _create_unique_index(conn, "owner_id")
+
+# 📦 v5: registro compacto (un sello AEAD por entrada), fechas epoch y propietario entero
+def _compact_records(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vault_owners (
+            id INTEGER PRIMARY KEY,
+            owner_id TEXT NOT NULL UNIQUE
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO vault_owners (owner_id) SELECT DISTINCT owner_id FROM vault_entries")
+
+    # 🧳 Las columnas antiguas se conservan (nulables) para las filas aún no reescritas
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vault_entries_compact (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner_ref INTEGER NOT NULL REFERENCES vault_owners (id),
+            service TEXT NOT NULL,
+            username TEXT NOT NULL,
+            record BLOB,
+            encrypted_password BLOB,
+            encrypted_notes BLOB,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER,
+            key_generation INTEGER NOT NULL DEFAULT 1
+        )
+    """)
+
+    # 🚚 Copia por lotes de id: si se interrumpe, continúa tras la última fila copiada
+    while True:
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM vault_entries_compact").fetchone()[0]
+        copied = conn.execute("""
+            INSERT INTO vault_entries_compact (
+                id, owner_ref, service, username, encrypted_password, encrypted_notes,
+                created_at, updated_at, key_generation
+            )
+            SELECT e.id, o.id, e.service, e.username, e.encrypted_password, e.encrypted_notes,
+                   COALESCE(CAST(strftime('%s', e.created_at) AS INTEGER), 0),
+                   CAST(strftime('%s', e.updated_at) AS INTEGER),
+                   e.key_generation
+            FROM vault_entries e
+            JOIN vault_owners o ON o.owner_id = e.owner_id
+            WHERE e.id > ?
+            ORDER BY e.id
+            LIMIT ?
+        """, (last_id, MIGRATION_BATCH_SIZE)).rowcount
+        if not copied:
+            break
+        yield copied
+
+    # 🔢 AUTOINCREMENT: no reutilizar ids de filas borradas antes de la migración
+    old_sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'vault_entries'").fetchone()
+    conn.execute("DROP TABLE vault_entries")
+    conn.execute("ALTER TABLE vault_entries_compact RENAME TO vault_entries")
+    sequence = conn.execute("SELECT COALESCE(MAX(id), 0) FROM vault_entries").fetchone()[0]
+    if old_sequence:
+        sequence = max(sequence, old_sequence[0])
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'vault_entries'")
+    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('vault_entries', ?)", (sequence,))
+
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vault_entries_owner_created
+        ON vault_entries (owner_ref, created_at, id, service, username)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vault_entries_service_username
+        ON vault_entries (service, username)
+    """)
+    _create_unique_index(conn, "owner_ref")
+
+# 🔄 v6: updated_at en el índice del listado (refresco incremental sin tocar la tabla)
+def _covering_updated_at(conn: sqlite3.Connection):
+    conn.execute("DROP INDEX IF EXISTS idx_vault_entries_owner_created")
+    conn.execute("""
+        CREATE INDEX idx_vault_entries_owner_created
+        ON vault_entries (owner_ref, created_at, id, service, username, updated_at)
+    """)
+
+# 📜 Migraciones en orden: (versión, descripción, función)
+MIGRATIONS = [
+    (1, "Esquema base", _base_schema),
+    (2, "Generación de clave por fila", _key_generation_column),
+    (3, "Índices de consulta", _hot_path_indexes),
+    (4, "Unicidad propietario/servicio/usuario", _unique_owner_service_username),
+    (5, "Registro compacto", _compact_records),
+    (6, "Índice de refresco incremental", _covering_updated_at),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# 🚚 Aplicar las migraciones pendientes
+# Las migraciones generadoras confirman cada lote al hacer yield: si se interrumpen, se
+# retoman al reabrir. Mientras tanto get_connection no devuelve ninguna conexión (_pool_lock).
+def migrate_database(conn: sqlite3.Connection, progress=None) -> int:
+    version = get_schema_version(conn)
+    for target, description, migration in MIGRATIONS:
+        if target <= version:
+            continue
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = migration(conn)
+            if inspect.isgenerator(result):
+                for batch in result:
+                    conn.commit()
+                    if progress:
+                        progress(target, description, batch)
+                    conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    return version
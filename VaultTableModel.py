@@ -0,0 +1,324 @@
+# Copyright © 2025 Juan Arnau
+# Licencia de uso restringido – ver LICENSE.txt
+# Juan Arnau
+
+from datetime import datetime
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, QRect, QEvent, Signal
+from PySide6.QtWidgets import QStyledItemDelegate
+from VaultDBManager import decrypt_entry, entry_cursor
+from VaultWorkers import LoadEntriesWorker
+
+SECRET_MASK = "••••••••"
+PAGE_SIZE = 200
+
+COLUMNS = ["Servicio", "Usuario", "Contraseña", "Notas", "Creado", "Acciones"]
+COL_SERVICE, COL_USERNAME, COL_PASSWORD, COL_NOTES, COL_CREATED, COL_ACTIONS = range(len(COLUMNS))
+FIELDS = {
+    COL_SERVICE: "service",
+    COL_USERNAME: "username",
+    COL_PASSWORD: "password",
+    COL_NOTES: "notes",
+    COL_CREATED: "created_at"
+}
+SECRET_COLUMNS = (COL_PASSWORD, COL_NOTES)
+
+# 🕒 Las fechas se guardan como epoch UTC: se muestran en hora local
+def format_timestamp(timestamp) -> str:
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M") if timestamp else ""
+
+# 📋 Modelo virtualizado: páginas de metadatos bajo demanda, secretos solo al mostrarlos
+class VaultEntriesModel(QAbstractTableModel):
+    load_failed = Signal(str)
+
+    def __init__(self, key: bytes, owner_id: str, page_size: int = PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.key = key
+        self.owner_id = owner_id
+        self.page_size = page_size
+
+        self.rows = []         # metadatos en orden de la vista
+        self.by_id = {}        # id -> metadatos
+        self.secrets = {}      # id -> {"password", "notes"} descifrados bajo demanda
+        self.revealed = set()  # ids que se muestran en claro
+        self.edits = {}        # id -> {campo: valor} pendientes de guardar
+
+        self.loader = None
+        self.load_token = 0
+        self.exhausted = False
+        self.refreshed = []            # metadatos recibidos durante un refresco
+        self.refresh_pending = False   # refresco pedido con una carga en curso
+
+    # 🔄 Vaciar y volver a pedir la primera página
+    def reload(self):
+        self.beginResetModel()
+        self.rows.clear()
+        self.by_id.clear()
+        self.secrets.clear()
+        self.revealed.clear()
+        self.edits.clear()
+        self.loader = None
+        self.load_token += 1
+        self.exhausted = False
+        self.refreshed = []
+        self.refresh_pending = False
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    # 🔄 Refresco incremental: se releen los metadatos de la ventana ya cargada y se
+    # aplican solo altas, bajas y cambios (sin reset: se conservan scroll y selección)
+    def refresh(self):
+        if self.loader is not None:
+            self.refresh_pending = True
+            return
+        self.refresh_pending = False
+        if not self.rows:
+            self.exhausted = False
+            self.fetchMore(QModelIndex())
+            return
+
+        until = None if self.exhausted else entry_cursor(self.rows[-1])
+        self.load_token += 1
+        self.refreshed = []
+        self.loader = LoadEntriesWorker(
+            self.owner_id, token=self.load_token, batch_size=self.page_size, until=until
+        )
+        self.loader.signals.batch.connect(self.collect_refresh)
+        self.loader.signals.finished.connect(self.on_refresh_loaded)
+        self.loader.signals.failed.connect(self.on_page_failed)
+        self.loader.start()
+
+    def collect_refresh(self, token, entries):
+        if token == self.load_token:
+            self.refreshed.extend(entries)
+
+    def on_refresh_loaded(self, token, count):
+        if token != self.load_token:
+            return
+        self.loader = None
+        fresh, self.refreshed = self.refreshed, []
+        self.apply_refresh(fresh)
+        if self.refresh_pending:
+            self.refresh()
+
+    def apply_refresh(self, fresh):
+        fresh_ids = {entry["id"] for entry in fresh}
+
+        # 🗑️ Bajas: de abajo arriba, por tramos contiguos
+        row = len(self.rows) - 1
+        while row >= 0:
+            if self.rows[row]["id"] in fresh_ids:
+                row -= 1
+                continue
+            end = row
+            while row >= 0 and self.rows[row]["id"] not in fresh_ids:
+                row -= 1
+            self.beginRemoveRows(QModelIndex(), row + 1, end)
+            for entry in self.rows[row + 1:end + 1]:
+                self.forget(entry["id"])
+            del self.rows[row + 1:end + 1]
+            self.endRemoveRows()
+
+        # ➕ Altas y ✏️ cambios en el orden de la vista (las filas que quedan siguen el mismo orden)
+        row = 0
+        while row < len(fresh):
+            entry = fresh[row]
+            if row < len(self.rows) and self.rows[row]["id"] == entry["id"]:
+                if self.rows[row] != entry:
+                    self.rows[row] = entry
+                    self.by_id[entry["id"]] = entry
+                    self.secrets.pop(entry["id"], None)
+                    self.dataChanged.emit(self.index(row, 0), self.index(row, COL_CREATED))
+                row += 1
+                continue
+            if entry["id"] in self.by_id:
+                # 🧯 Orden inesperado (no debería ocurrir): recarga completa
+                self.reload()
+                return
+            start = row
+            while row < len(fresh) and fresh[row]["id"] not in self.by_id:
+                row += 1
+            self.beginInsertRows(QModelIndex(), start, row - 1)
+            self.rows[start:start] = fresh[start:row]
+            for inserted in fresh[start:row]:
+                self.by_id[inserted["id"]] = inserted
+            self.endInsertRows()
+
+    def forget(self, entry_id):
+        self.by_id.pop(entry_id, None)
+        self.secrets.pop(entry_id, None)
+        self.revealed.discard(entry_id)
+        self.edits.pop(entry_id, None)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section]
+        return None
+
+    # 📥 Paginación: la vista pide más filas al acercarse al final
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted or self.loader is not None:
+            return
+        # 📍 Keyset: la siguiente página empieza tras la última fila cargada
+        after = entry_cursor(self.rows[-1]) if self.rows else None
+        self.loader = LoadEntriesWorker(
+            self.owner_id, token=self.load_token, batch_size=self.page_size,
+            after=after, limit=self.page_size
+        )
+        self.loader.signals.batch.connect(self.append_page)
+        self.loader.signals.finished.connect(self.on_page_loaded)
+        self.loader.signals.failed.connect(self.on_page_failed)
+        self.loader.start()
+
+    def append_page(self, token, entries):
+        if token != self.load_token or not entries:
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(entries) - 1)
+        for entry in entries:
+            self.rows.append(entry)
+            self.by_id[entry["id"]] = entry
+        self.endInsertRows()
+
+    def on_page_loaded(self, token, count):
+        if token != self.load_token:
+            return
+        self.loader = None
+        if count < self.page_size:
+            self.exhausted = True
+        if self.refresh_pending:
+            self.refresh()
+
+    def on_page_failed(self, token, error):
+        if token != self.load_token:
+            return
+        self.loader = None
+        self.exhausted = True
+        self.refreshed = []
+        self.refresh_pending = False
+        self.load_failed.emit(error)
+
+    def entry_id(self, row):
+        return self.rows[row]["id"] if 0 <= row < len(self.rows) else None
+
+    # 🔓 Descifrado perezoso y cacheado de una sola entrada
+    def secrets_for(self, entry_id):
+        if entry_id not in self.secrets:
+            self.secrets[entry_id] = decrypt_entry(self.key, entry_id)
+        return self.secrets[entry_id]
+
+    def value(self, entry_id, field):
+        edited = self.edits.get(entry_id, {})
+        if field in edited:
+            return edited[field]
+        if field in ("password", "notes"):
+            return self.secrets_for(entry_id)[field]
+        return self.by_id[entry_id][field]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry_id = self.rows[index.row()]["id"]
+        column = index.column()
+
+        if role == Qt.UserRole:
+            return entry_id
+        if role not in (Qt.DisplayRole, Qt.EditRole) or column == COL_ACTIONS:
+            return None
+
+        field = FIELDS[column]
+        if column in SECRET_COLUMNS and role == Qt.DisplayRole and entry_id not in self.revealed:
+            return SECRET_MASK
+        if column == COL_CREATED:
+            return format_timestamp(self.by_id[entry_id]["created_at"])
+        try:
+            # 🔐 data() solo se pide para celdas visibles: nunca se descifra la bóveda entera
+            return self.value(entry_id, field)
+        except Exception:
+            return "❌ Error"
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.isValid() and index.column() in FIELDS and index.column() != COL_CREATED:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    # ✏️ Las ediciones quedan pendientes hasta "Guardar cambios"
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not (self.flags(index) & Qt.ItemIsEditable):
+            return False
+        entry_id = self.rows[index.row()]["id"]
+        field = FIELDS[index.column()]
+        if value == self.value(entry_id, field):
+            return False
+        self.edits.setdefault(entry_id, {})[field] = value
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+        return True
+
+    def reveal(self, row):
+        entry_id = self.entry_id(row)
+        if entry_id is None or entry_id in self.revealed:
+            return
+        self.secrets_for(entry_id)
+        self.revealed.add(entry_id)
+        self.dataChanged.emit(self.index(row, COL_PASSWORD), self.index(row, COL_NOTES))
+
+    def has_changes(self) -> bool:
+        return bool(self.edits)
+
+    # 💾 Tras guardar: las ediciones ya están en la base (refresh trae los valores nuevos)
+    def clear_edits(self):
+        for entry_id in list(self.edits):
+            self.secrets.pop(entry_id, None)
+        self.edits.clear()
+
+    # 💾 Filas modificadas listas para update_entries
+    def pending_updates(self):
+        for entry_id in list(self.edits):
+            yield {
+                "id": entry_id,
+                "service": self.value(entry_id, "service"),
+                "username": self.value(entry_id, "username"),
+                "password": self.value(entry_id, "password"),
+                "notes": self.value(entry_id, "notes")
+            }
+
+# 🗑️ Acciones de fila pintadas por el delegado (sin widgets por fila)
+class EntryActionsDelegate(QStyledItemDelegate):
+    copy_requested = Signal(int)
+    delete_requested = Signal(int)
+
+    def action_rects(self, rect):
+        half = rect.width() // 2
+        copy_rect = QRect(rect.left(), rect.top(), half, rect.height())
+        delete_rect = QRect(rect.left() + half, rect.top(), rect.width() - half, rect.height())
+        return copy_rect, delete_rect
+
+    def paint(self, painter, option, index):
+        super().paint(painter, option, index)
+        copy_rect, delete_rect = self.action_rects(option.rect)
+        painter.save()
+        painter.drawText(copy_rect, Qt.AlignCenter, "📋")
+        painter.drawText(delete_rect, Qt.AlignCenter, "🗑️")
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            pos = event.position().toPoint()
+            copy_rect, delete_rect = self.action_rects(option.rect)
+            entry_id = index.data(Qt.UserRole)
+            if copy_rect.contains(pos):
+                self.copy_requested.emit(entry_id)
+                return True
+            if delete_rect.contains(pos):
+                self.delete_requested.emit(entry_id)
+                return True
+        return False
@@ -0,0 +1,105 @@
+# Copyright © 2025 Juan Arnau
+# Licencia de uso restringido – ver LICENSE.txt
+# Juan Arnau
+
+import hashlib
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from VaultDBManager import initialize_database, open_vault, iter_entries
+from VaultIntegrity import verify_vault, write_report
+from vaultion_boot import get_database_path
+
+LOAD_BATCH_SIZE = 200
+
+# 📡 Señales de los trabajos en segundo plano (se entregan en el hilo de la UI)
+class WorkerSignals(QObject):
+    progress = Signal(int, str)     # token, mensaje de etapa
+    step = Signal(int, int, int)    # token, hechos, total
+    batch = Signal(int, object)     # token, lote de filas
+    finished = Signal(int, object)  # token, resultado
+    failed = Signal(int, str)       # token, error
+
+# 🧵 Trabajo base: cada ejecución lleva un token para descartar resultados obsoletos
+class VaultWorker(QRunnable):
+    def __init__(self, token: int = 0):
+        super().__init__()
+        # 🧷 El objeto Python vive mientras la ventana lo referencie (no lo borra el pool)
+        self.setAutoDelete(False)
+        self.token = token
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            result = self.work()
+        except Exception as e:
+            self.signals.failed.emit(self.token, str(e))
+        else:
+            self.signals.finished.emit(self.token, result)
+
+    def work(self):
+        raise NotImplementedError
+
+    def start(self):
+        QThreadPool.globalInstance().start(self)
+        return self
+
+# 🔐 Desbloqueo: leer clave, preparar la base y derivar la clave fuera del hilo de la UI
+class UnlockWorker(VaultWorker):
+    def __init__(self, key_file, token: int = 0):
+        super().__init__(token)
+        self.key_file = key_file
+
+    def work(self):
+        self.signals.progress.emit(self.token, "📖 Leyendo clave USB...")
+        with open(self.key_file, "rb") as f:
+            raw_key = f.read()
+
+        self.signals.progress.emit(self.token, "🧱 Preparando base de datos...")
+        initialize_database(get_database_path())
+
+        self.signals.progress.emit(self.token, "🔐 Derivando clave de la bóveda...")
+        owner_id = hashlib.sha256(raw_key).hexdigest().upper()[:16]
+        key = open_vault(raw_key, owner_id)
+        return {"raw_key": raw_key, "key": key}
+
+# 📋 Carga de la tabla: metadatos en streaming, emitidos por lotes a medida que llegan
+class LoadEntriesWorker(VaultWorker):
+    def __init__(self, owner_id: str, token: int = 0, batch_size: int = LOAD_BATCH_SIZE,
+                 after=None, limit: int = None, until=None):
+        super().__init__(token)
+        self.owner_id = owner_id
+        self.batch_size = batch_size
+        self.after = after
+        self.limit = limit
+        self.until = until
+
+    def work(self):
+        count = 0
+        batch = []
+        for entry in iter_entries(self.owner_id, after=self.after, limit=self.limit,
+                                  page_size=self.batch_size, until=self.until):
+            batch.append(entry)
+            if len(batch) == self.batch_size:
+                self.signals.batch.emit(self.token, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.signals.batch.emit(self.token, batch)
+            count += len(batch)
+        return count
+
+# 🛡️ Verificación de integridad (y reparación opcional) con progreso por páginas
+class IntegrityWorker(VaultWorker):
+    def __init__(self, key: bytes, owner_id: str, repair: bool = False, token: int = 0):
+        super().__init__(token)
+        self.key = key
+        self.owner_id = owner_id
+        self.repair = repair
+
+    def work(self):
+        self.signals.progress.emit(self.token, "🧱 Comprobando la base de datos...")
+        report = verify_vault(
+            self.key, self.owner_id, repair=self.repair,
+            progress=lambda done, total: self.signals.step.emit(self.token, done, total)
+        )
+        report["report_path"] = write_report(report)
+        return report
@@ -2,62 +2,321 @@
 # Licencia de uso restringido – ver LICENSE.txt
 # Juan Arnau
  
+import os
 import json
+import time
+import sqlite3
+import hashlib
+import threading
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
+from cryptography.hazmat.primitives import serialization
 
-AUTHORIZED_KEYS_PATH = Path.home() / ".vaultion" / "authorized_keys.json"
+AUTHORIZED_KEYS_DB_PATH = Path.home() / ".vaultion" / "authorized_keys.db"
+AUTHORIZED_KEYS_PATH = Path.home() / ".vaultion" / "authorized_keys.json"  # 🧳 formato antiguo
+# 🧳 Ficheros JSON que se importan una vez al crear la base (el de KeyManagerWindow era relativo al cwd)
+LEGACY_KEY_PATHS = [AUTHORIZED_KEYS_PATH, Path("authorized_keys.json")]
+AUTHORIZED_KEYS_CHECK_INTERVAL = 1.0  # segundos entre comprobaciones de cambios de otras conexiones
+KEY_STORE_VERSION = 1
+
+# 🗝️ Una fila por clave; revocar marca revoked_at (se conserva el historial)
+KEY_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS authorized_keys (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    alias TEXT NOT NULL,
+    usb_id TEXT NOT NULL UNIQUE,
+    fingerprint TEXT,
+    public_key TEXT NOT NULL,
+    registered_at TEXT NOT NULL,
+    origin TEXT,
+    comment TEXT,
+    revoked_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_authorized_keys_fingerprint ON authorized_keys(fingerprint);
+CREATE INDEX IF NOT EXISTS idx_authorized_keys_alias ON authorized_keys(alias);
+"""
+
+KEY_COLUMNS = ["alias", "usb_id", "fingerprint", "public_key", "registered_at", "origin", "comment", "revoked_at"]
+
+# 🧬 Huella SHA-256 del SubjectPublicKeyInfo (DER): no depende de saltos de línea ni del formato del PEM
+@lru_cache(maxsize=1024)
+def key_fingerprint(public_key_pem: str) -> str:
+    public_key = serialization.load_pem_public_key(public_key_pem.encode())
+    spki = public_key.public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return hashlib.sha256(spki).hexdigest()
+
+def _safe_fingerprint(public_key_pem):
+    try:
+        return key_fingerprint(public_key_pem)
+    except (ValueError, TypeError, AttributeError):
+        return None  # ⚠️ PEM ilegible: se guarda, pero nunca autoriza nada
+
+def _utcnow() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+# 🗝️ Registro de claves en SQLite, compartido por KeyManagerWindow y la verificación USB
+# Cada cambio es una transacción sobre una fila (sin reescribir el fichero entero).
+# Las comprobaciones de autorización se cachean por huella; la caché se vacía con cada
+# escritura propia y cuando PRAGMA data_version delata cambios de otra conexión o proceso.
+class AuthorizedKeyRegistry:
+    def __init__(self, path=AUTHORIZED_KEYS_DB_PATH, legacy_paths=None,
+                 check_interval: float = AUTHORIZED_KEYS_CHECK_INTERVAL):
+        self.path = Path(path)
+        self.legacy_paths = LEGACY_KEY_PATHS if legacy_paths is None else legacy_paths
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._conn = None
+        self._authorized = {}  # huella -> bool
+        self._data_version = None
+        self._checked_at = 0.0
+
+    def connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(KEY_STORE_SCHEMA)
+            self._conn = conn
+            if conn.execute("PRAGMA user_version").fetchone()[0] < KEY_STORE_VERSION:
+                self._migrate_legacy()
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._authorized.clear()
+
+    # 🧳 Importar los JSON antiguos una sola vez (se conservan renombrados como .migrated)
+    def _migrate_legacy(self):
+        seen = set()
+        migrated = []
+        for legacy in self.legacy_paths:
+            legacy = Path(legacy)
+            if not legacy.exists() or legacy.resolve() in seen:
+                continue
+            seen.add(legacy.resolve())
+            try:
+                with open(legacy, "r", encoding="utf-8") as f:
+                    entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ No se pudo importar {legacy}: {e}")
+                continue
+            self.import_keys(entries, origin="legacy")
+            migrated.append(legacy)
+        with self._conn:
+            self._conn.execute(f"PRAGMA user_version = {KEY_STORE_VERSION}")
+        for legacy in migrated:
+            os.replace(legacy, legacy.with_name(legacy.name + ".migrated"))
+
+    # 🔄 Otra conexión (u otro proceso) cambió la tabla: olvidar las respuestas cacheadas
+    def _refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and self._data_version is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        version = self.connection().execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._authorized.clear()
+            self._data_version = version
+
+    def _changed(self):
+        self._authorized.clear()
+
+    @staticmethod
+    def _entry(row) -> dict:
+        return dict(row) if row is not None else None
+
+    def is_authorized(self, public_key: str) -> bool:
+        fingerprint = _safe_fingerprint(public_key)
+        if fingerprint is None:
+            return False
+        with self._lock:
+            self._refresh()
+            authorized = self._authorized.get(fingerprint)
+            if authorized is None:
+                authorized = bool(self.connection().execute(
+                    "SELECT EXISTS(SELECT 1 FROM authorized_keys WHERE fingerprint = ? AND revoked_at IS NULL)",
+                    (fingerprint,)
+                ).fetchone()[0])
+                self._authorized[fingerprint] = authorized
+            return authorized
+
+    def entries(self, include_revoked: bool = False) -> list:
+        where = "" if include_revoked else "WHERE revoked_at IS NULL"
+        with self._lock:
+            rows = self.connection().execute(
+                f"SELECT {', '.join(KEY_COLUMNS)} FROM authorized_keys {where} ORDER BY id"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_by_usb(self, usb_id: str):
+        with self._lock:
+            return self._entry(self.connection().execute(
+                f"SELECT {', '.join(KEY_COLUMNS)} FROM authorized_keys WHERE usb_id = ?", (usb_id,)
+            ).fetchone())
+
+    def get_by_fingerprint(self, fingerprint: str):
+        with self._lock:
+            return self._entry(self.connection().execute(
+                f"SELECT {', '.join(KEY_COLUMNS)} FROM authorized_keys WHERE fingerprint = ? AND revoked_at IS NULL "
+                "ORDER BY id LIMIT 1", (fingerprint,)
+            ).fetchone())
+
+    def find_by_alias(self, alias: str, include_revoked: bool = False) -> list:
+        revoked = "" if include_revoked else "AND revoked_at IS NULL"
+        with self._lock:
+            rows = self.connection().execute(
+                f"SELECT {', '.join(KEY_COLUMNS)} FROM authorized_keys WHERE alias = ? {revoked} ORDER BY id", (alias,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    # ➕ Un usb_id revocado se puede volver a registrar: la fila se reactiva con los datos nuevos
+    def add(self, alias, public_key, usb_id, origin="usb", comment="") -> bool:
+        with self._lock:
+            conn = self.connection()
+            with conn:
+                cursor = conn.execute("""
+                    INSERT INTO authorized_keys (alias, usb_id, fingerprint, public_key, registered_at, origin, comment)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(usb_id) DO UPDATE SET
+                        alias = excluded.alias, fingerprint = excluded.fingerprint,
+                        public_key = excluded.public_key, registered_at = excluded.registered_at,
+                        origin = excluded.origin, comment = excluded.comment, revoked_at = NULL
+                    WHERE authorized_keys.revoked_at IS NOT NULL
+                """, (alias, usb_id, _safe_fingerprint(public_key), public_key, _utcnow(), origin, comment))
+            self._changed()
+            return cursor.rowcount == 1
+
+    @staticmethod
+    def _import_rows(entries, origin: str) -> list:
+        return [
+            (entry.get("alias") or entry.get("usb_id"), entry["usb_id"], _safe_fingerprint(entry["public_key"]),
+             entry["public_key"], entry.get("registered_at") or _utcnow(), entry.get("origin") or origin,
+             entry.get("comment", ""), entry.get("revoked_at"))
+            for entry in entries
+            if entry.get("usb_id") and entry.get("public_key")
+        ]
+
+    # 📥 Importación masiva en una transacción; los usb_id activos se ignoran
+    # y los revocados se reactivan si la entrada importada no viene revocada
+    def import_keys(self, entries, origin: str = "import", replace: bool = False) -> int:
+        rows = self._import_rows(entries, origin)
+        with self._lock:
+            conn = self.connection()
+            with conn:
+                if replace:
+                    conn.execute("DELETE FROM authorized_keys")
+                before = conn.total_changes
+                conn.executemany("""
+                    INSERT INTO authorized_keys
+                        (alias, usb_id, fingerprint, public_key, registered_at, origin, comment, revoked_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(usb_id) DO UPDATE SET
+                        alias = excluded.alias, fingerprint = excluded.fingerprint,
+                        public_key = excluded.public_key, registered_at = excluded.registered_at,
+                        origin = excluded.origin, comment = excluded.comment, revoked_at = NULL
+                    WHERE authorized_keys.revoked_at IS NOT NULL AND excluded.revoked_at IS NULL
+                """, rows)
+                inserted = conn.total_changes - before
+            self._changed()
+            return inserted
+
+    # 🚫 Revocar (una o muchas) por usb_id: una transacción, sin reescribir el resto
+    def revoke(self, usb_ids) -> int:
+        if isinstance(usb_ids, str):
+            usb_ids = [usb_ids]
+        now = _utcnow()
+        with self._lock:
+            conn = self.connection()
+            before = conn.total_changes
+            with conn:
+                conn.executemany(
+                    "UPDATE authorized_keys SET revoked_at = ? WHERE usb_id = ? AND revoked_at IS NULL",
+                    [(now, usb_id) for usb_id in usb_ids]
+                )
+            self._changed()
+            return conn.total_changes - before
+
+    def revoke_alias(self, alias: str) -> int:
+        return self.revoke([entry["usb_id"] for entry in self.find_by_alias(alias)])
+
+    # 📤 Exportación en streaming como array JSON (el formato de los ficheros antiguos)
+    def export_keys(self, path, include_revoked: bool = False) -> int:
+        where = "" if include_revoked else "WHERE revoked_at IS NULL"
+        count = 0
+        with self._lock:
+            cursor = self.connection().execute(
+                f"SELECT {', '.join(KEY_COLUMNS)} FROM authorized_keys {where} ORDER BY id"
+            )
+            with open(path, "w", encoding="utf-8") as out:
+                out.write("[")
+                for row in cursor:
+                    out.write(",\n  " if count else "\n  ")
+                    out.write(json.dumps(dict(row), ensure_ascii=False))
+                    count += 1
+                out.write("\n]\n" if count else "]\n")
+        return count
+
+    # 🔁 Reemplazar el registro completo en una sola transacción (compatibilidad con save_authorized_keys)
+    def replace_all(self, entries) -> int:
+        return self.import_keys(entries, replace=True)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry() -> AuthorizedKeyRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = AuthorizedKeyRegistry()
+        return _registry
 
 def load_authorized_keys():
-    if not AUTHORIZED_KEYS_PATH.exists():
-        return []
-    with open(AUTHORIZED_KEYS_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return get_registry().entries()
 
 def save_authorized_keys(data):
-    AUTHORIZED_KEYS_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with open(AUTHORIZED_KEYS_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    get_registry().replace_all(data)
 
 def add_key_extended(alias, public_key, usb_id, origin="usb", comment=""):
-    keys = load_authorized_keys()
+    return get_registry().add(alias, public_key, usb_id, origin, comment)
 
-    # Verificar si ya existe una clave con ese usb_id
-    for entry in keys:
-        if entry["usb_id"] == usb_id:
-            return False
+def add_key(alias, public_key, usb_id):
+    return add_key_extended(alias, public_key, usb_id)
 
-    new_entry = {
-        "alias": alias,
-        "usb_id": usb_id,
-        "public_key": public_key,
-        "registered_at": datetime.utcnow().isoformat() + "Z",
-        "origin": origin,
-        "comment": comment
-    }
+def import_keys(entries, origin="import"):
+    return get_registry().import_keys(entries, origin)
+
+def revoke_key(usb_id):
+    return get_registry().revoke(usb_id) > 0
 
-    keys.append(new_entry)
-    save_authorized_keys(keys)
-    return True
+def remove_key(alias):
+    return get_registry().revoke_alias(alias) > 0
 
 def remove_key_by_index(index):
     keys = load_authorized_keys()
     if 0 <= index < len(keys):
-        removed = keys.pop(index)
-        save_authorized_keys(keys)
-        return True
+        return revoke_key(keys[index]["usb_id"])
     else:
         return False
 
 def is_key_authorized(public_key):
-    keys = load_authorized_keys()
-    return any(entry["public_key"] == public_key for entry in keys)
+    return get_registry().is_authorized(public_key)
 
 def list_keys():
-    keys = load_authorized_keys()
-    for i, entry in enumerate(keys):
-        if entry.get("comment"):
-            pass
+    return {
+        entry["alias"]: {"usb_id": entry["usb_id"], "added": entry["registered_at"]}
+        for entry in load_authorized_keys()
+    }
+
+def export_keys(filepath, include_revoked=False):
+    return get_registry().export_keys(filepath, include_revoked)
 
 def export_key_by_index(index, filepath):
     keys = load_authorized_keys()
@@ -66,4 +325,4 @@ def export_key_by_index(index, filepath):
             f.write(keys[index]["public_key"])
         return True
     else:
-        return False
\ No newline at end of file
+        return False
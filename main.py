@@ -10,7 +10,7 @@ from PySide6.QtCore import Qt, QTimer
 
 # 🔧 Módulos internos
 from vaultion_boot import boot_vaultion, get_database_path
-from VaultDBManager import initialize_database
+from VaultDBManager import initialize_database, end_session
 from UnlockScreen import UnlockScreen
 from vaultion_theme import aplicar_estilo
 
@@ -47,5 +47,8 @@ unlock.show()
 # ⏱️ Cerrar splash después de mostrar ventana principal
 QTimer.singleShot(2000, lambda: splash.finish(unlock))
 
+# 🔒 Al salir, por cualquier camino: olvidar DEKs, cachés y conexiones
+app.aboutToQuit.connect(end_session)
+
 # 🚀 Ejecutar aplicación
 sys.exit(app.exec())
@@ -5,6 +5,8 @@
 import sys
 import uuid
 import json
+import hashlib
+import threading
 from pathlib import Path
 from PySide6.QtWidgets import QMessageBox
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
@@ -18,6 +20,10 @@ VAULTION_HOME.mkdir(parents=True, exist_ok=True)
 DB_PATH = VAULTION_HOME / "vaultion.db"
 LOCAL_KEY_PATH = VAULTION_HOME / "vaultion.key"
 
+# 🧠 Sesión activa: clave USB resuelta y validada una sola vez
+_session = {"key_path": None, "mtime_ns": None, "size": None, "digest": None}
+_session_lock = threading.Lock()
+
 # 🔍 Detectar USB dinámicamente
 def detect_usb_key():
     for part in psutil.disk_partitions():
@@ -40,6 +46,54 @@ def validate_key(key_path: Path) -> bool:
     except Exception:
         return False
 
+# 🧬 Huella SHA-256 del archivo de clave
+def _file_digest(key_path: Path) -> str:
+    with open(key_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+# 🔓 Abrir sesión: validar la clave y recordar su estado en disco
+def open_session(key_path: Path) -> bool:
+    if key_path is None or not validate_key(key_path):
+        close_session()
+        return False
+    try:
+        stat = key_path.stat()
+        digest = _file_digest(key_path)
+    except OSError:
+        close_session()
+        return False
+    _session.update(key_path=key_path, mtime_ns=stat.st_mtime_ns, size=stat.st_size, digest=digest)
+    return True
+
+# 🔒 Cerrar sesión: la próxima consulta vuelve a detectar el USB
+def close_session():
+    _session.update(key_path=None, mtime_ns=None, size=None, digest=None)
+
+# ✅ La sesión sigue siendo válida si el USB no se retiró y la clave no cambió
+def _session_is_valid() -> bool:
+    key_path = _session["key_path"]
+    if key_path is None:
+        return False
+    try:
+        stat = key_path.stat()
+    except OSError:
+        close_session()
+        return False
+    if stat.st_mtime_ns == _session["mtime_ns"] and stat.st_size == _session["size"]:
+        return True
+
+    # 🔍 mtime o tamaño distintos: solo se invalida si el contenido cambió
+    try:
+        digest = _file_digest(key_path)
+    except OSError:
+        close_session()
+        return False
+    if digest != _session["digest"]:
+        close_session()
+        return False
+    _session.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    return True
+
 # 🧬 Crear nueva clave
 def generate_new_key(target_path: Path) -> Path:
     private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
@@ -100,7 +154,9 @@ def boot_vaultion() -> Path:
             QMessageBox.Yes | QMessageBox.No
         )
         if reply == QMessageBox.Yes:
-            return generate_new_key(key_path)
+            key_path = generate_new_key(key_path)
+            open_session(key_path)
+            return key_path
         else:
             sys.exit(0)
 
@@ -117,17 +173,22 @@ def boot_vaultion() -> Path:
             except Exception as e:
                 QMessageBox.critical(None, "Error", f"No se pudo eliminar la clave:\n{e}")
                 sys.exit(1)
-            return generate_new_key(key_path)
+            key_path = generate_new_key(key_path)
+            open_session(key_path)
+            return key_path
         else:
             sys.exit(0)
 
+    open_session(key_path)
     return key_path
 
 # 📁 Ruta de base de datos
 def get_database_path() -> Path:
-    key_path = detect_usb_key()
-    if not validate_key(key_path):
-        raise RuntimeError("Clave inválida detectada en get_database_path()")
+    with _session_lock:
+        if _session_is_valid():
+            return DB_PATH
+        if not open_session(detect_usb_key()):
+            raise RuntimeError("Clave inválida detectada en get_database_path()")
     return DB_PATH
 
 # 📦 Cargar datos de clave